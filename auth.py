@@ -50,6 +50,44 @@ class AuthenticationHandler:
             logger.error(f"Error verifying code: {e}")
             return False, error_msg
     
+    async def initiate_pool_login(self, phone):
+        """Initiate login of an extra pooled account"""
+        try:
+            is_valid, phone_or_error = ValidationHelper.validate_phone_number(phone)
+            if not is_valid:
+                return False, phone_or_error
+            
+            await self.clients.login_pool_account(phone_or_error)
+            return True, "Verification code sent to that account's Telegram app"
+        
+        except FloodWaitError as e:
+            error_msg = f"Rate limited. Wait {e.seconds} seconds"
+            logger.warning(error_msg)
+            return False, error_msg
+        except Exception as e:
+            error_msg = ErrorHandler.get_error_message(e)
+            logger.error(f"Error initiating pool login: {e}")
+            return False, error_msg
+    
+    async def verify_pool_code(self, phone, code, password=None):
+        """Verify a pooled account login with code and optional 2FA password"""
+        try:
+            is_valid = ValidationHelper.validate_verification_code(code)
+            if not is_valid:
+                return False, "Invalid verification code format"
+            
+            _, phone = ValidationHelper.validate_phone_number(phone)
+            account_id = await self.clients.login_pool_account_with_code(phone, code, password, self.db)
+            return True, f"Account {account_id} added to the pool!"
+        
+        except SessionPasswordNeededError:
+            logger.warning("2FA password needed")
+            return False, "2FA_REQUIRED"
+        except Exception as e:
+            error_msg = ErrorHandler.get_error_message(e)
+            logger.error(f"Error verifying pool code: {e}")
+            return False, error_msg
+    
     async def check_login_status(self):
         """Check both account login status"""
         try:
@@ -0,0 +1,139 @@
+import asyncio
+import time
+from datetime import datetime
+import logging
+from config import CHECKPOINT_FLUSH_INTERVAL, CHECKPOINT_FLUSH_COUNT
+
+logger = logging.getLogger(__name__)
+
+class ProgressCheckpointer:
+    """Write-behind store for task progress
+    
+    Engines record progress in memory; the latest values per task are
+    coalesced and written with one bulk_write when CHECKPOINT_FLUSH_COUNT
+    updates are pending or CHECKPOINT_FLUSH_INTERVAL seconds have passed.
+    """
+    
+    def __init__(self, db, flush_interval=CHECKPOINT_FLUSH_INTERVAL, flush_count=CHECKPOINT_FLUSH_COUNT):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.flush_count = flush_count
+        self.pending = {}
+        self.pending_updates = 0
+        self.last_flush = time.monotonic()
+        self._flush_loop = None
+        # Count-triggered flushes still running, so close() can wait for them
+        self._flushes = set()
+    
+    def _ensure_loop(self):
+        if self._flush_loop is None or self._flush_loop.done():
+            self._flush_loop = asyncio.create_task(self._run())
+    
+    def _entry(self, task_id):
+        self._ensure_loop()
+        self.pending_updates += 1
+        if self.pending_updates >= self.flush_count:
+            self.pending_updates = 0
+            flush = asyncio.create_task(self.flush())
+            self._flushes.add(flush)
+            flush.add_done_callback(self._flushes.discard)
+        return self.pending.setdefault(task_id, {"$set": {}, "$inc": {}})
+    
+    def set(self, task_id, fields):
+        """Queue $set of dotted task fields"""
+        entry = self._entry(task_id)
+        for field, value in fields.items():
+            entry["$inc"].pop(field, None)
+            entry["$set"][field] = value
+    
+    def increment(self, task_id, fields):
+        """Queue $inc of dotted task fields"""
+        entry = self._entry(task_id)
+        for field, amount in fields.items():
+            # A pending $set of the same field absorbs the increment
+            if field in entry["$set"]:
+                entry["$set"][field] += amount
+            else:
+                entry["$inc"][field] = entry["$inc"].get(field, 0) + amount
+    
+    def update_progress(self, task_id, forwarded_count, total_messages, last_message_id):
+        """Queue the same update as Database.update_task_progress"""
+        self.set(task_id, {
+            "progress.forwarded_count": forwarded_count,
+            "progress.total_messages": total_messages,
+            "progress.last_forwarded_message_id": last_message_id
+        })
+    
+    def _restore(self, pending):
+        """Put back updates whose write failed, under anything queued since"""
+        for task_id, old in pending.items():
+            entry = self.pending.get(task_id)
+            if entry is None:
+                self.pending[task_id] = old
+                continue
+            for field, value in old["$set"].items():
+                if field in entry["$set"]:
+                    continue
+                if field in entry["$inc"]:
+                    entry["$set"][field] = value + entry["$inc"].pop(field)
+                else:
+                    entry["$set"][field] = value
+            for field, amount in old["$inc"].items():
+                # A newer $set already replaced the value
+                if field in entry["$set"]:
+                    continue
+                entry["$inc"][field] = entry["$inc"].get(field, 0) + amount
+        self._ensure_loop()
+    
+    async def flush(self, task_id=None):
+        """Write pending updates for one task, or for all tasks
+        
+        Returns False if the write failed; the updates are then kept and
+        retried on the next flush.
+        """
+        if task_id is None:
+            pending, self.pending = self.pending, {}
+            self.pending_updates = 0
+            self.last_flush = time.monotonic()
+        else:
+            entry = self.pending.pop(task_id, None)
+            pending = {task_id: entry} if entry else {}
+        
+        if not pending:
+            return True
+        
+        now = datetime.utcnow()
+        updates = []
+        for pending_task_id, entry in pending.items():
+            update = {"$set": dict(entry["$set"], **{"progress.last_forwarded_at": now, "updated_at": now})}
+            if entry["$inc"]:
+                update["$inc"] = entry["$inc"]
+            updates.append((pending_task_id, update))
+        
+        if not await self.db.bulk_update_tasks(updates):
+            self._restore(pending)
+            logger.warning(f"Progress write for {len(updates)} tasks failed, will retry")
+            return False
+        logger.debug(f"Flushed progress for {len(updates)} tasks")
+        return True
+    
+    async def _run(self):
+        """Flush on the time threshold"""
+        try:
+            while self.pending:
+                await asyncio.sleep(max(0.0, self.last_flush + self.flush_interval - time.monotonic()))
+                if time.monotonic() - self.last_flush >= self.flush_interval:
+                    await self.flush()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Error in progress checkpointer: {e}")
+    
+    async def close(self):
+        """Stop the flush loop and write everything still pending"""
+        if self._flush_loop is not None:
+            self._flush_loop.cancel()
+            self._flush_loop = None
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        await self.flush()
@@ -1,4 +1,5 @@
 from telethon import TelegramClient
+from telethon.sessions import StringSession
 from telegram import Bot
 from telethon.errors import SessionPasswordNeededError
 import logging
@@ -6,6 +7,9 @@ import os
 
 logger = logging.getLogger(__name__)
 
+# Account ID of the user client logged in through /login_user
+PRIMARY_ACCOUNT_ID = "primary"
+
 class TelegramClients:
     def __init__(self, api_id, api_hash, bot_token):
         self.api_id = api_id
@@ -14,6 +18,10 @@ class TelegramClients:
         self.user_client = None
         self.bot_client = None
         self.telegram_bot = None
+        # Extra user accounts for spreading tasks, keyed by account ID
+        self.account_pool = {}
+        # Pooled accounts waiting for their login code, keyed by phone
+        self.pending_pool_logins = {}
     
     async def load_sessions(self, db):
         """Load sessions from MongoDB"""
@@ -31,6 +39,35 @@ class TelegramClients:
         except Exception as e:
             logger.error(f"Error loading sessions: {e}")
     
+    async def load_account_pool(self, db):
+        """Connect every pooled user account stored in MongoDB"""
+        try:
+            for doc in await db.get_pool_sessions():
+                account_id = doc.get("account_id")
+                if not account_id or account_id in self.account_pool:
+                    continue
+                try:
+                    client = TelegramClient(StringSession(doc["session"]), self.api_id, self.api_hash)
+                    await client.connect()
+                    if not await client.is_user_authorized():
+                        logger.warning(f"Pooled account {account_id} is not authorized, skipping")
+                        await client.disconnect()
+                        continue
+                    self.account_pool[account_id] = client
+                    logger.info(f"Pooled account {account_id} connected")
+                except Exception as e:
+                    logger.error(f"Error connecting pooled account {account_id}: {e}")
+        except Exception as e:
+            logger.error(f"Error loading account pool: {e}")
+    
+    def get_user_accounts(self):
+        """Get every usable user account as {account_id: client}"""
+        accounts = {}
+        if self.user_client:
+            accounts[PRIMARY_ACCOUNT_ID] = self.user_client
+        accounts.update(self.account_pool)
+        return accounts
+    
     async def start_user_client(self):
         """Start user account client"""
         try:
@@ -86,6 +123,54 @@ class TelegramClients:
             logger.error(f"Error logging in user: {e}")
             raise
     
+    async def login_pool_account(self, phone):
+        """Send a login code for an extra pooled account"""
+        try:
+            client = self.pending_pool_logins.get(phone)
+            if client is None:
+                client = TelegramClient(StringSession(), self.api_id, self.api_hash)
+                await client.connect()
+                self.pending_pool_logins[phone] = client
+            
+            await client.send_code_request(phone)
+            logger.info(f"Pool login code sent to {phone}")
+            return True
+        except Exception as e:
+            logger.error(f"Error during pooled account login: {e}")
+            raise
+    
+    async def login_pool_account_with_code(self, phone, code, password=None, db=None):
+        """Complete a pooled account login and add it to the pool
+        
+        The account is keyed by its Telegram user ID and its session string
+        is saved, so load_account_pool reconnects it after a restart.
+        """
+        try:
+            client = self.pending_pool_logins.get(phone)
+            if client is None:
+                raise Exception("Login expired, start again with /add_account")
+            
+            try:
+                await client.sign_in(phone, code)
+            except SessionPasswordNeededError:
+                if password:
+                    await client.sign_in(password=password)
+                else:
+                    raise Exception("2FA password required")
+            
+            me = await client.get_me()
+            account_id = str(me.id)
+            if db:
+                await db.save_pool_session(account_id, client.session.save())
+            
+            del self.pending_pool_logins[phone]
+            self.account_pool[account_id] = client
+            logger.info(f"Pooled account {account_id} logged in")
+            return account_id
+        except Exception as e:
+            logger.error(f"Error logging in pooled account: {e}")
+            raise
+    
     async def is_user_logged_in(self):
         """Check if user is logged in"""
         try:
@@ -136,6 +221,9 @@ class TelegramClients:
             if self.user_client:
                 await self.user_client.disconnect()
                 logger.info("User client stopped")
+            for account_id, client in self.account_pool.items():
+                await client.disconnect()
+                logger.info(f"Pooled account {account_id} stopped")
         except Exception as e:
             logger.error(f"Error stopping clients: {e}")
     
@@ -1,7 +1,8 @@
 from telethon import events
+import json
 import logging
 from message_formatter import MessageFormatter
-from utils import ValidationHelper, ChannelValidator
+from utils import ValidationHelper, ChannelValidator, TaskOptionsValidator
 
 logger = logging.getLogger(__name__)
 
@@ -23,7 +24,8 @@ def setup_command_handlers(bot_client, clients, db, task_manager, auth_handler):
                 f"{status}\n\n"
                 "ðŸ“‹ COMMANDS:\n\n"
                 "ðŸ” LOGIN:\n"
-                "/login_user - Login with user account (phone + 2FA)\n\n"
+                "/login_user - Login with user account (phone + 2FA)\n"
+                "/add_account - Add another user account to the pool\n\n"
                 "âš™ï¸ CHANNEL MANAGEMENT:\n"
                 "/add_source - Add a source channel\n"
                 "/add_dest - Add a destination channel\n"
@@ -33,6 +35,8 @@ def setup_command_handlers(bot_client, clients, db, task_manager, auth_handler):
                 "ðŸ“Š TASKS:\n"
                 "/forward - Forward entire channel (complete)\n"
                 "/autoforward - Auto-forward new messages (live)\n"
+                "/fanout - Forward one channel to several destinations\n"
+                "/task_options - Set a task's mode, filters, rewrite and dedupe\n"
                 "/status - Show active tasks\n"
                 "/help - Show help\n"
             )
@@ -64,6 +68,21 @@ def setup_command_handlers(bot_client, clients, db, task_manager, auth_handler):
             logger.error(f"Error in login_user handler: {e}")
             await event.respond(MessageFormatter.format_error_message(str(e)))
     
+    @bot_client.on(events.NewMessage(pattern='/add_account'))
+    async def add_account_handler(event):
+        try:
+            user_id = event.sender_id
+            pending_auth[user_id] = {"step": "phone", "type": "pool_login", "phone": None, "code": None}
+            
+            await event.respond(
+                "ðŸ“± STEP 1/3: Enter the phone number of the account to add\n"
+                "Format: +91xxxxxxxxxx (with country code)\n\n"
+                "Example: +911234567890"
+            )
+        except Exception as e:
+            logger.error(f"Error in add_account handler: {e}")
+            await event.respond(MessageFormatter.format_error_message(str(e)))
+    
     # ==================== CHANNEL MANAGEMENT ====================
     
     @bot_client.on(events.NewMessage(pattern='/add_source'))
@@ -206,6 +225,46 @@ def setup_command_handlers(bot_client, clients, db, task_manager, auth_handler):
             logger.error(f"Error in autoforward handler: {e}")
             await event.respond(MessageFormatter.format_error_message(str(e)))
     
+    @bot_client.on(events.NewMessage(pattern='/fanout'))
+    async def fanout_handler(event):
+        try:
+            user_id = event.sender_id
+            sources = await db.get_source_channels(user_id)
+            
+            if not sources:
+                await event.respond("âŒ No source channels. Add one:\n/add_source")
+                return
+            
+            pending_auth[user_id] = {"step": "select_source", "type": "fanout", "sources": sources}
+            
+            message = "Select SOURCE channel:\n\n"
+            message += "\n".join([f"{i+1}. {ch}" for i, ch in enumerate(sources)])
+            await event.respond(message)
+        except Exception as e:
+            logger.error(f"Error in fanout handler: {e}")
+            await event.respond(MessageFormatter.format_error_message(str(e)))
+    
+    @bot_client.on(events.NewMessage(pattern='/task_options'))
+    async def task_options_handler(event):
+        try:
+            user_id = event.sender_id
+            tasks = await db.get_user_tasks(user_id)
+            if not tasks:
+                await event.respond("ðŸ“Š No tasks yet")
+                return
+            
+            pending_auth[user_id] = {"step": "select_task", "type": "task_options", "tasks": [task["_id"] for task in tasks]}
+            
+            message = "Select the task to configure:\n\n"
+            message += "\n".join([
+                f"{i+1}. {task['_id']} ({task.get('type')}, {task.get('status')}) {task.get('source_channel')}"
+                for i, task in enumerate(tasks)
+            ])
+            await event.respond(message)
+        except Exception as e:
+            logger.error(f"Error in task_options handler: {e}")
+            await event.respond(MessageFormatter.format_error_message(str(e)))
+    
     @bot_client.on(events.NewMessage(pattern='/status'))
     async def status_handler(event):
         try:
@@ -228,7 +287,8 @@ def setup_command_handlers(bot_client, clients, db, task_manager, auth_handler):
             message = (
                 "ðŸ“– HELP\n\n"
                 "ðŸ” LOGIN:\n"
-                "/login_user - Login with phone\n\n"
+                "/login_user - Login with phone\n"
+                "/add_account - Add a pooled account\n\n"
                 "ðŸ“¢ CHANNELS:\n"
                 "/add_source - Add source channel\n"
                 "/add_dest - Add destination channel\n"
@@ -238,6 +298,8 @@ def setup_command_handlers(bot_client, clients, db, task_manager, auth_handler):
                 "âš¡ TASKS:\n"
                 "/forward - Forward ALL messages\n"
                 "/autoforward - Auto-forward NEW messages\n"
+                "/fanout - Forward ALL messages to several destinations\n"
+                "/task_options - Edit a task's options (JSON)\n"
                 "/status - Show active tasks\n"
             )
             await event.respond(message)
@@ -309,6 +371,43 @@ def setup_command_handlers(bot_client, clients, db, task_manager, auth_handler):
                     
                     del pending_auth[user_id]
             
+            # ========== POOLED ACCOUNT LOGIN FLOW ==========
+            elif flow_type == "pool_login":
+                if step == "phone":
+                    success, result = await auth_handler.initiate_pool_login(message_text)
+                    if success:
+                        pending_auth[user_id]["phone"] = message_text
+                        pending_auth[user_id]["step"] = "code"
+                        await event.respond(
+                            "âœ… Code sent to your Telegram!\n\n"
+                            "ðŸ“± STEP 2/3: Enter verification code"
+                        )
+                    else:
+                        await event.respond(MessageFormatter.format_error_message(result))
+                        del pending_auth[user_id]
+                
+                elif step == "code":
+                    phone = pending_auth[user_id].get("phone")
+                    pending_auth[user_id]["code"] = message_text
+                    pending_auth[user_id]["step"] = "password"
+                    await event.respond(
+                        "ðŸ” STEP 3/3: Enter 2FA password\n"
+                        "(Type 'skip' if not enabled)"
+                    )
+                
+                elif step == "password":
+                    phone = pending_auth[user_id].get("phone")
+                    code = pending_auth[user_id].get("code")
+                    pwd = None if message_text.lower() == "skip" else message_text
+                    
+                    success, result = await auth_handler.verify_pool_code(phone, code, pwd)
+                    if success:
+                        await event.respond(f"âœ… {result}")
+                    else:
+                        await event.respond(MessageFormatter.format_error_message(result))
+                    
+                    del pending_auth[user_id]
+            
             # ========== ADD SOURCE ==========
             elif flow_type == "add_source" and step == "source":
                 is_valid, identifier = ChannelValidator.validate_channel_identifier(message_text)
@@ -450,6 +549,110 @@ def setup_command_handlers(bot_client, clients, db, task_manager, auth_handler):
                         await event.respond("âŒ Invalid selection")
                 except ValueError:
                     await event.respond("âŒ Send number only")
+            
+            # ========== FANOUT - SELECT SOURCE ==========
+            elif flow_type == "fanout" and step == "select_source":
+                sources = pending_auth[user_id].get("sources", [])
+                try:
+                    idx = int(message_text) - 1
+                    if 0 <= idx < len(sources):
+                        source = sources[idx]
+                        dests = await db.get_dest_channels(user_id)
+                        if not dests:
+                            await event.respond("âŒ No destination channels. Add one:\n/add_dest")
+                            del pending_auth[user_id]
+                            return
+                        
+                        pending_auth[user_id]["step"] = "select_dests"
+                        pending_auth[user_id]["source_channel"] = source
+                        pending_auth[user_id]["dests"] = dests
+                        
+                        message = f"âœ… Source: {source}\n\nSelect DESTINATION channels (e.g. 1,3):\n\n"
+                        message += "\n".join([f"{i+1}. {ch}" for i, ch in enumerate(dests)])
+                        await event.respond(message)
+                    else:
+                        await event.respond("âŒ Invalid selection")
+                except ValueError:
+                    await event.respond("âŒ Send number only")
+            
+            # ========== FANOUT - SELECT DESTINATIONS ==========
+            elif flow_type == "fanout" and step == "select_dests":
+                dests = pending_auth[user_id].get("dests", [])
+                try:
+                    indexes = [int(part) - 1 for part in message_text.split(",") if part.strip()]
+                    if indexes and all(0 <= idx < len(dests) for idx in indexes):
+                        selected = []
+                        for idx in indexes:
+                            if dests[idx] not in selected:
+                                selected.append(dests[idx])
+                        source = pending_auth[user_id].get("source_channel")
+                        
+                        # Determine auth method (user or bot)
+                        user_logged = await clients.is_user_logged_in()
+                        auth_method = "user_account" if user_logged else "bot_account"
+                        
+                        task_id = await task_manager.start_forward_task_direct(
+                            source, selected, auth_method, "fanout", user_id
+                        )
+                        
+                        await event.respond(
+                            f"âœ… Fan-out task started!\n\n"
+                            f"From: {source}\n"
+                            f"To: {', '.join(selected)}\n"
+                            f"Task ID: {task_id}\n\n"
+                            "/status - to monitor"
+                        )
+                        del pending_auth[user_id]
+                    else:
+                        await event.respond("âŒ Invalid selection")
+                except ValueError:
+                    await event.respond("âŒ Send numbers separated by commas")
+            
+            # ========== TASK OPTIONS - SELECT TASK ==========
+            elif flow_type == "task_options" and step == "select_task":
+                task_ids = pending_auth[user_id].get("tasks", [])
+                try:
+                    idx = int(message_text) - 1
+                    if 0 <= idx < len(task_ids):
+                        task = await db.get_task(task_ids[idx])
+                        if not task or task.get("user_id") != user_id:
+                            await event.respond("âŒ Task not found")
+                            del pending_auth[user_id]
+                            return
+                        
+                        pending_auth[user_id]["step"] = "options"
+                        pending_auth[user_id]["task_id"] = task["_id"]
+                        
+                        current = {key: task[key] for key in TaskOptionsValidator.KEYS if key in task}
+                        await event.respond(
+                            f"âœ… Task: {task['_id']}\n\n"
+                            f"Current options: {json.dumps(current, default=str)}\n\n"
+                            "Send the options to set as JSON, e.g.\n"
+                            '{"mode": "copy", "rewrite": {"strip_links": true}, "dedupe": true}\n\n'
+                            "Keys: mode, filters, rewrite, dedupe"
+                        )
+                    else:
+                        await event.respond("âŒ Invalid selection")
+                except ValueError:
+                    await event.respond("âŒ Send number only")
+            
+            # ========== TASK OPTIONS - SET OPTIONS ==========
+            elif flow_type == "task_options" and step == "options":
+                valid, result = TaskOptionsValidator.validate_task_options(message_text)
+                if not valid:
+                    await event.respond(f"âŒ {result}")
+                    return
+                
+                task_id = pending_auth[user_id].get("task_id")
+                if await db.update_task_options(task_id, result):
+                    await event.respond(
+                        f"âœ… Options saved for task {task_id}\n\n"
+                        "A running task picks up mode, filters and rewrite now; dedupe applies from its next start."
+                    )
+                else:
+                    await event.respond("âŒ Could not save options, try again")
+                    return
+                del pending_auth[user_id]
         
         except Exception as e:
             logger.error(f"Error in message handler: {e}")
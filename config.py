@@ -1,4 +1,5 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -21,7 +22,14 @@ RATE_LIMITS = {
         "batch_size": 50,
         "batch_cooldown": 10,
         "max_forwards_per_minute": 40,
-        "backoff_multiplier": 2.0
+        "burst": 3,
+        "backoff_multiplier": 2.0,
+        "adaptive": True,
+        "aimd_increase": 2,
+        "aimd_increase_every": 20,
+        "aimd_decrease": 0.5,
+        "min_forwards_per_minute": 10,
+        "ceiling_forwards_per_minute": 120
     },
     "bot_account": {
         "base_delay": 0.3,
@@ -30,11 +38,85 @@ RATE_LIMITS = {
         "batch_size": 100,
         "batch_cooldown": 5,
         "max_forwards_per_minute": 80,
-        "backoff_multiplier": 1.5
+        "burst": 5,
+        "backoff_multiplier": 1.5,
+        "adaptive": True,
+        "aimd_increase": 4,
+        "aimd_increase_every": 20,
+        "aimd_decrease": 0.5,
+        "min_forwards_per_minute": 20,
+        "ceiling_forwards_per_minute": 240
     }
 }
 
+# Seconds between saves of an adaptively learned rate
+LEARNED_RATE_SAVE_INTERVAL = 60
+
+# A FloodWait at least this long moves tasks to another pooled account
+ACCOUNT_FAILOVER_FLOOD_SECONDS = 300
+
+# Write-behind progress checkpoints
+CHECKPOINT_FLUSH_INTERVAL = 5  # seconds
+CHECKPOINT_FLUSH_COUNT = 500  # pending updates
+
+# Content dedupe across sources, per destination
+DEDUPE_ENABLED = os.getenv('DEDUPE_ENABLED', 'false').lower() == 'true'  # default for tasks without a "dedupe" field
+DEDUPE_CAPACITY = 1000000  # hashes in the largest Bloom filter generation
+DEDUPE_INITIAL_CAPACITY = 10000  # first generation; each new one doubles up to DEDUPE_CAPACITY
+DEDUPE_ERROR_RATE = 0.001  # chance a new message is wrongly dropped as a duplicate
+DEDUPE_LRU_SIZE = 10000  # recent hashes kept exactly
+DEDUPE_SAVE_INTERVAL = 60  # seconds between saves of the filters
+
+# Streaming re-upload of media from sources that restrict forwarding
+MEDIA_PART_SIZE = 512 * 1024  # bytes per download chunk and upload part
+MEDIA_PIPE_CHUNKS = 4  # chunks buffered between a file's download and upload
+MEDIA_BYTES_IN_FLIGHT = 32 * 1024 * 1024  # buffered media bytes across all tasks
+MEDIA_PARALLEL_FILES = 3  # files re-uploaded at once across all tasks
+MEDIA_BIG_FILE_SIZE = 10 * 1024 * 1024  # larger files use the big-file upload API
+
+# Per-destination circuit breaker
+CIRCUIT_FAILURE_THRESHOLD = 3  # consecutive failures that open a destination's circuit
+CIRCUIT_COOLDOWN = 60  # seconds before the first half-open probe; doubles per failed probe
+CIRCUIT_MAX_COOLDOWN = 1800  # longest wait between probes
+CIRCUIT_POLL_INTERVAL = 5  # seconds between stop checks while waiting on an open circuit
+
+# Dead-letter retries
+DEAD_LETTER_POLL_INTERVAL = 30  # seconds between scans for due entries
+DEAD_LETTER_SCAN_LIMIT = 500  # due entries read per scan
+DEAD_LETTER_BASE_DELAY = 60  # seconds before the first retry; doubles per attempt
+DEAD_LETTER_MAX_DELAY = 6 * 3600  # longest wait between retries
+DEAD_LETTER_MAX_ATTEMPTS = {  # by error class; exhausted entries stay for inspection
+    "retryable": 8,
+    "destination": 8,
+    "skip": 2,
+    "fatal": 1
+}
+
+# Task ownership across bot replicas
+INSTANCE_ID = os.getenv('INSTANCE_ID') or f"{socket.gethostname()}-{os.getpid()}"
+TASK_LEASE_SECONDS = 60  # a task is taken over this long after its owner's last renewal
+TASK_LEASE_HEARTBEAT = 15  # seconds between lease renewals and rebalancing
+TASK_REBALANCE_MARGIN = 1  # tasks above its fair share a replica keeps before handing one off
+
+# Task commands from other replicas and direct database edits
+CONTROL_PLANE_MODE = os.getenv('CONTROL_PLANE_MODE', 'auto')  # "stream", "poll", or "auto" to poll where change streams are unsupported
+CONTROL_POLL_INTERVAL = 2  # seconds between reads of local tasks' controls when polling
+CONTROL_RECONNECT_DELAY = 5  # seconds before reopening a failed change stream
+
 # Task settings
 MAX_RETRIES = 5
 TASK_TIMEOUT = 3600
 PROGRESS_UPDATE_BATCH = 100
+TOTAL_COUNT_REFRESH_INTERVAL = 300  # seconds between history count refreshes
+FANOUT_QUEUE_BATCHES = 10  # batches a fan-out destination may lag behind the reader
+PIPELINE_FETCH_AHEAD = 5  # history batches prefetched ahead of the forward stage
+PIPELINE_RECORD_QUEUE = 100  # checkpoint/error records buffered for the checkpointer
+SHARD_PREFETCH_BATCHES = 10  # batches each backfill shard may fetch ahead of the commit stage
+BACKFILL_PRESERVE_ORDER = True  # sharded backfills commit in source order
+LIVE_CATCHUP_MAX_MESSAGES = 10000  # most messages a live task backfills after downtime
+LIVE_SYNC_WINDOW = 2.0  # seconds edits and deletes are collected before one batched sync
+LIVE_ALBUM_WINDOW = 1.0  # seconds to collect the rest of an album before sending it
+TASK_STOP_GRACE = 30  # seconds a stopped task may finish its batch before it is cancelled
+
+# Telegram accepts at most this many message IDs per forward request
+MAX_FORWARD_BATCH = 100
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+from pymongo.errors import OperationFailure
+from utils import TaskFatalError
+from config import CONTROL_PLANE_MODE, CONTROL_POLL_INTERVAL, CONTROL_RECONNECT_DELAY
+
+logger = logging.getLogger(__name__)
+
+# Task fields that carry commands; progress writes never wake the listener
+CONFIG_FIELDS = ("mode", "filters", "rewrite")
+CONTROL_FIELDS = ("status",) + CONFIG_FIELDS
+
+# Mongo's error code for change streams on a standalone server
+CHANGE_STREAM_UNSUPPORTED = 40573
+
+class TaskControlPlane:
+    """Pushes task status and config edits to this replica's task runtimes
+    
+    A change stream on tasks, filtered server-side to CONTROL_FIELDS,
+    delivers pause, resume, stop and config edits made by any replica (or
+    directly in Mongo) as they happen. Where change streams are unavailable,
+    a polling loop reads the control fields of local tasks instead.
+    """
+    
+    def __init__(self, db, task_manager, mode=CONTROL_PLANE_MODE):
+        self.db = db
+        self.task_manager = task_manager
+        self.mode = mode
+        self.resume_token = None
+        # Polling only: last control fields seen per task
+        self.snapshots = {}
+        self._loop = None
+    
+    def start(self):
+        if self._loop is None or self._loop.done():
+            self._loop = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._loop is not None:
+            self._loop.cancel()
+            self._loop = None
+    
+    async def _run(self):
+        if self.mode != "poll":
+            await self._watch()
+        await self._poll()
+    
+    async def _watch(self):
+        """Follow the change stream, reopening it from the last token on errors"""
+        while True:
+            try:
+                async with self.db.watch_task_controls(CONTROL_FIELDS, resume_after=self.resume_token) as stream:
+                    logger.info("Task control plane listening on change stream")
+                    async for change in stream:
+                        self.resume_token = change["_id"]
+                        await self.handle_change(change)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAM_UNSUPPORTED and self.mode == "auto":
+                    logger.warning("Change streams unsupported, polling task controls instead")
+                    return
+                logger.error(f"Task control stream failed: {e}")
+            except Exception as e:
+                logger.error(f"Task control stream failed: {e}")
+            await asyncio.sleep(CONTROL_RECONNECT_DELAY)
+    
+    async def _poll(self):
+        """Fallback: re-read local tasks' control fields every CONTROL_POLL_INTERVAL"""
+        while True:
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error polling task controls: {e}")
+            await asyncio.sleep(CONTROL_POLL_INTERVAL)
+    
+    async def handle_change(self, change):
+        task = change.get("fullDocument")
+        if not task:
+            return
+        task["_id"] = str(task["_id"])
+        updated = (change.get("updateDescription") or {}).get("updatedFields") or {}
+        config_changed = change["operationType"] == "replace" or any(
+            field.split(".")[0] in CONFIG_FIELDS for field in updated
+        )
+        await self.apply(task, config_changed)
+    
+    async def poll_once(self):
+        task_ids = list(self.task_manager.active_tasks)
+        self.snapshots = {task_id: self.snapshots[task_id] for task_id in task_ids if task_id in self.snapshots}
+        if not task_ids:
+            return
+        for task in await self.db.get_task_controls(task_ids, CONTROL_FIELDS):
+            config = {field: task.get(field) for field in CONFIG_FIELDS}
+            previous = self.snapshots.get(task["_id"])
+            self.snapshots[task["_id"]] = config
+            await self.apply(task, previous is not None and previous != config)
+    
+    async def apply(self, task, config_changed=False):
+        """Bring a local task's runtime in line with its document"""
+        task_id = task["_id"]
+        runtime = self.task_manager.active_tasks.get(task_id)
+        if runtime is None:
+            return
+        
+        status = task.get("status")
+        if status == "PAUSED" and runtime.status == "RUNNING":
+            runtime.pause()
+            await self.task_manager.checkpointer.flush(task_id)
+            logger.info(f"Task {task_id} paused by control plane")
+        elif status == "RUNNING" and runtime.status == "PAUSED":
+            runtime.resume()
+            logger.info(f"Task {task_id} resumed by control plane")
+        elif status in ("STOPPED", "DELETED"):
+            self.task_manager.detach_task(task_id)
+            logger.info(f"Task {task_id} stopped by control plane")
+            return
+        
+        if config_changed:
+            try:
+                for engine in runtime.engines:
+                    engine.apply_config(task)
+            except TaskFatalError as e:
+                # Don't keep forwarding under rules the user meant to replace
+                await self.db.add_error_log(task_id, str(e))
+                await self.db.update_task_status(task_id, "ERROR")
+                self.task_manager.detach_task(task_id)
+                logger.error(f"Task {task_id} stopped: {e}")
+                return
+            logger.info(f"Task {task_id} settings reloaded")
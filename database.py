@@ -1,5 +1,6 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from datetime import datetime
+from pymongo import UpdateOne, ReturnDocument
+from datetime import datetime, timedelta
 import logging
 from bson import ObjectId
 
@@ -17,11 +18,29 @@ class Database:
             self.client = AsyncIOMotorClient(self.uri)
             self.db = self.client[self.db_name]
             await self.client.admin.command('ping')
+            await self.ensure_indexes()
             logger.info("Connected to MongoDB")
         except Exception as e:
             logger.error(f"Failed to connect to MongoDB: {e}")
             raise
     
+    async def ensure_indexes(self):
+        try:
+            await self.db.message_map.create_index(
+                [("task_id", 1), ("dest_channel", 1), ("source_msg_id", 1)],
+                unique=True
+            )
+            await self.db.dead_letters.create_index(
+                [("task_id", 1), ("dest_channel", 1), ("message_id", 1)],
+                unique=True
+            )
+            await self.db.dead_letters.create_index("next_retry_at")
+            await self.db.tasks.create_index([("status", 1), ("lease.expires_at", 1)])
+            # Replicas that stop heartbeating drop out on their own
+            await self.db.instances.create_index("expires_at", expireAfterSeconds=0)
+        except Exception as e:
+            logger.error(f"Error creating indexes: {e}")
+
     async def close(self):
         if self.client:
             self.client.close()
@@ -50,6 +69,33 @@ class Database:
             logger.error(f"Error getting user session: {e}")
             return None
 
+    async def save_pool_session(self, account_id, session_string):
+        try:
+            await self.db.sessions.update_one(
+                {"type": "pool_account", "account_id": account_id},
+                {"$set": {
+                    "type": "pool_account",
+                    "account_id": account_id,
+                    "session": session_string,
+                    "updated_at": datetime.utcnow()
+                }},
+                upsert=True
+            )
+            logger.info(f"Pooled account session saved: {account_id}")
+        except Exception as e:
+            logger.error(f"Error saving pooled account session: {e}")
+            raise
+
+    async def get_pool_sessions(self):
+        try:
+            sessions = []
+            async for doc in self.db.sessions.find({"type": "pool_account"}):
+                sessions.append(doc)
+            return sessions
+        except Exception as e:
+            logger.error(f"Error getting pooled account sessions: {e}")
+            return []
+
     async def session_exists(self, session_type):
         try:
             session = await self.db.sessions.find_one({"type": session_type})
@@ -58,6 +104,29 @@ class Database:
             logger.error(f"Error checking session: {e}")
             return False
 
+    # Learned Rate Limits
+    async def save_learned_rate(self, account_key, forwards_per_minute):
+        try:
+            await self.db.rate_limits.update_one(
+                {"account": account_key},
+                {"$set": {
+                    "account": account_key,
+                    "forwards_per_minute": forwards_per_minute,
+                    "updated_at": datetime.utcnow()
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Error saving learned rate: {e}")
+
+    async def get_learned_rate(self, account_key):
+        try:
+            doc = await self.db.rate_limits.find_one({"account": account_key})
+            return doc.get("forwards_per_minute") if doc else None
+        except Exception as e:
+            logger.error(f"Error getting learned rate: {e}")
+            return None
+
     # Source Channel Management
     async def add_source_channel(self, user_id, channel_identifier):
         try:
@@ -121,7 +190,7 @@ class Database:
             return []
 
     # Task Management
-    async def create_task(self, source_channel, dest_channel, auth_method, task_type, user_id):
+    async def create_task(self, source_channel, dest_channel, auth_method, task_type, user_id, options=None):
         try:
             task = {
                 "user_id": user_id,
@@ -133,6 +202,7 @@ class Database:
                 "progress": {
                     "total_messages": 0,
                     "forwarded_count": 0,
+                    "retried_count": 0,
                     "last_forwarded_message_id": 0,
                     "last_forwarded_at": datetime.utcnow(),
                     "start_time": datetime.utcnow(),
@@ -142,6 +212,17 @@ class Database:
                 "created_at": datetime.utcnow(),
                 "updated_at": datetime.utcnow()
             }
+            if isinstance(dest_channel, list):
+                # Fan-out: one checkpoint per destination
+                task["dest_channel"] = None
+                task["dest_channels"] = dest_channel
+                task["progress"]["destinations"] = {
+                    dest: {"forwarded_count": 0, "last_forwarded_message_id": 0}
+                    for dest in dest_channel
+                }
+            if options:
+                # Per-task settings such as mode, rewrite, filters and dedupe
+                task.update(options)
             result = await self.db.tasks.insert_one(task)
             logger.info(f"Task created: {result.inserted_id}")
             return str(result.inserted_id)
@@ -174,6 +255,29 @@ class Database:
         except Exception as e:
             logger.error(f"Error updating task progress: {e}")
 
+    async def update_task_total(self, task_id, total_messages):
+        try:
+            await self.db.tasks.update_one(
+                {"_id": ObjectId(task_id)},
+                {"$set": {
+                    "progress.total_messages": total_messages,
+                    "updated_at": datetime.utcnow()
+                }}
+            )
+        except Exception as e:
+            logger.error(f"Error updating task total: {e}")
+
+    async def bulk_update_tasks(self, updates):
+        """Apply (task_id, update) pairs in one bulk_write; returns False if it failed"""
+        try:
+            operations = [UpdateOne({"_id": ObjectId(task_id)}, update) for task_id, update in updates]
+            if operations:
+                await self.db.tasks.bulk_write(operations, ordered=False)
+            return True
+        except Exception as e:
+            logger.error(f"Error bulk updating tasks: {e}")
+            return False
+
     async def update_task_status(self, task_id, status):
         try:
             await self.db.tasks.update_one(
@@ -184,6 +288,27 @@ class Database:
         except Exception as e:
             logger.error(f"Error updating task status: {e}")
 
+    async def update_task_options(self, task_id, options):
+        """Set a task's per-task settings; running tasks reload them via the control plane"""
+        try:
+            await self.db.tasks.update_one(
+                {"_id": ObjectId(task_id)},
+                {"$set": {**options, "updated_at": datetime.utcnow()}}
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error updating task options: {e}")
+            return False
+
+    async def update_task_account(self, task_id, account_id):
+        try:
+            await self.db.tasks.update_one(
+                {"_id": ObjectId(task_id)},
+                {"$set": {"account_id": account_id, "updated_at": datetime.utcnow()}}
+            )
+        except Exception as e:
+            logger.error(f"Error updating task account: {e}")
+
     async def add_error_log(self, task_id, error_message):
         try:
             await self.db.tasks.update_one(
@@ -225,4 +350,262 @@ class Database:
             return 0
         except Exception as e:
             logger.error(f"Error getting last forwarded message ID: {e}")
-            return 0                        
+            return 0
+
+    # Message Mapping
+    async def bulk_upsert_message_map(self, task_id, dest_channel, entries):
+        """Upsert (source_msg_id, dest_msg_id, fields) entries; fields may hold content and edited_at"""
+        try:
+            operations = [
+                UpdateOne(
+                    {"task_id": task_id, "dest_channel": dest_channel, "source_msg_id": source_msg_id},
+                    {"$set": {"dest_msg_id": dest_msg_id, **fields, "updated_at": datetime.utcnow()}},
+                    upsert=True
+                )
+                for source_msg_id, dest_msg_id, fields in entries
+            ]
+            if operations:
+                await self.db.message_map.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.error(f"Error saving message map: {e}")
+
+    async def iter_delivered_message_ids(self, task_id, dest_channel):
+        try:
+            cursor = self.db.message_map.find(
+                {"task_id": task_id, "dest_channel": dest_channel},
+                {"source_msg_id": 1, "_id": 0}
+            )
+            async for doc in cursor:
+                yield doc["source_msg_id"]
+        except Exception as e:
+            logger.error(f"Error reading message map: {e}")
+
+    async def get_message_mappings(self, task_id, dest_channel, source_msg_ids):
+        try:
+            mappings = {}
+            cursor = self.db.message_map.find(
+                {"task_id": task_id, "dest_channel": dest_channel, "source_msg_id": {"$in": list(source_msg_ids)}},
+                {"source_msg_id": 1, "dest_msg_id": 1, "_id": 0}
+            )
+            async for doc in cursor:
+                mappings[doc["source_msg_id"]] = doc["dest_msg_id"]
+            return mappings
+        except Exception as e:
+            logger.error(f"Error getting message mappings: {e}")
+            return {}
+
+    async def get_message_map_entries(self, task_id, dest_channel, source_msg_ids):
+        try:
+            entries = {}
+            cursor = self.db.message_map.find(
+                {"task_id": task_id, "dest_channel": dest_channel, "source_msg_id": {"$in": list(source_msg_ids)}},
+                {"source_msg_id": 1, "dest_msg_id": 1, "content": 1, "edited_at": 1, "_id": 0}
+            )
+            async for doc in cursor:
+                entries[doc.pop("source_msg_id")] = doc
+            return entries
+        except Exception as e:
+            logger.error(f"Error getting message map entries: {e}")
+            return {}
+
+    async def delete_message_mappings(self, task_id, dest_channel, source_msg_ids):
+        try:
+            await self.db.message_map.delete_many(
+                {"task_id": task_id, "dest_channel": dest_channel, "source_msg_id": {"$in": list(source_msg_ids)}}
+            )
+        except Exception as e:
+            logger.error(f"Error deleting message mappings: {e}")
+
+    # Content Dedupe
+    async def save_dedupe_state(self, dest_channel, state):
+        try:
+            await self.db.dedupe_filters.update_one(
+                {"dest_channel": dest_channel},
+                {"$set": dict(state, dest_channel=dest_channel, updated_at=datetime.utcnow())},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Error saving dedupe state: {e}")
+
+    async def get_dedupe_state(self, dest_channel):
+        try:
+            return await self.db.dedupe_filters.find_one({"dest_channel": dest_channel})
+        except Exception as e:
+            logger.error(f"Error getting dedupe state: {e}")
+            return None
+
+    # Dead Letters
+    async def add_dead_letters(self, entries):
+        try:
+            now = datetime.utcnow()
+            operations = [
+                UpdateOne(
+                    {"task_id": entry["task_id"], "dest_channel": entry["dest_channel"], "message_id": entry["message_id"]},
+                    {
+                        "$set": dict(entry, updated_at=now),
+                        "$setOnInsert": {"attempts": 0, "created_at": now}
+                    },
+                    upsert=True
+                )
+                for entry in entries
+            ]
+            if operations:
+                await self.db.dead_letters.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.error(f"Error adding dead letters: {e}")
+
+    async def get_due_dead_letters(self, now, limit):
+        try:
+            cursor = self.db.dead_letters.find({"next_retry_at": {"$lte": now}}).sort("next_retry_at", 1).limit(limit)
+            return await cursor.to_list(length=limit)
+        except Exception as e:
+            logger.error(f"Error getting due dead letters: {e}")
+            return []
+
+    async def update_dead_letters(self, updates):
+        try:
+            now = datetime.utcnow()
+            operations = [
+                UpdateOne({"_id": entry_id}, {"$set": dict(fields, updated_at=now)})
+                for entry_id, fields in updates
+            ]
+            if operations:
+                await self.db.dead_letters.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.error(f"Error updating dead letters: {e}")
+
+    async def delete_dead_letters(self, entry_ids):
+        try:
+            if entry_ids:
+                await self.db.dead_letters.delete_many({"_id": {"$in": list(entry_ids)}})
+        except Exception as e:
+            logger.error(f"Error deleting dead letters: {e}")
+
+    # Task Leases
+    async def claim_task(self, task_id, owner_id, lease_seconds, statuses=("RUNNING", "PAUSED")):
+        """Atomically take a task's lease if it is free, expired or already ours"""
+        try:
+            now = datetime.utcnow()
+            query = {
+                "_id": ObjectId(task_id),
+                "$or": [
+                    {"lease": None},
+                    {"lease.owner": owner_id},
+                    {"lease.expires_at": {"$lt": now}}
+                ]
+            }
+            if statuses:
+                query["status"] = {"$in": list(statuses)}
+            task = await self.db.tasks.find_one_and_update(
+                query,
+                {"$set": {"lease": {"owner": owner_id, "expires_at": now + timedelta(seconds=lease_seconds)}}},
+                return_document=ReturnDocument.AFTER
+            )
+            if task:
+                task["_id"] = str(task["_id"])
+            return task
+        except Exception as e:
+            logger.error(f"Error claiming task: {e}")
+            return None
+
+    async def renew_task_leases(self, task_ids, owner_id, lease_seconds):
+        """Extend our leases; returns the IDs still owned, or None if unknown"""
+        try:
+            query = {"_id": {"$in": [ObjectId(task_id) for task_id in task_ids]}, "lease.owner": owner_id}
+            await self.db.tasks.update_many(
+                query,
+                {"$set": {"lease.expires_at": datetime.utcnow() + timedelta(seconds=lease_seconds)}}
+            )
+            return {str(task["_id"]) async for task in self.db.tasks.find(query, {"_id": 1})}
+        except Exception as e:
+            logger.error(f"Error renewing task leases: {e}")
+            return None
+
+    async def release_task_lease(self, task_id, owner_id):
+        try:
+            await self.db.tasks.update_one(
+                {"_id": ObjectId(task_id), "lease.owner": owner_id},
+                {"$unset": {"lease": ""}}
+            )
+        except Exception as e:
+            logger.error(f"Error releasing task lease: {e}")
+
+    async def get_orphaned_tasks(self, now, limit):
+        """RUNNING tasks whose lease is missing or expired"""
+        try:
+            cursor = self.db.tasks.find({
+                "status": "RUNNING",
+                "$or": [{"lease": None}, {"lease.expires_at": {"$lt": now}}]
+            }).limit(limit)
+            tasks = []
+            async for task in cursor:
+                task["_id"] = str(task["_id"])
+                tasks.append(task)
+            return tasks
+        except Exception as e:
+            logger.error(f"Error getting orphaned tasks: {e}")
+            return []
+
+    async def count_running_tasks(self):
+        try:
+            return await self.db.tasks.count_documents({"status": "RUNNING"})
+        except Exception as e:
+            logger.error(f"Error counting running tasks: {e}")
+            return 0
+
+    # Instances
+    async def heartbeat_instance(self, instance_id, load, lease_seconds):
+        try:
+            now = datetime.utcnow()
+            await self.db.instances.update_one(
+                {"_id": instance_id},
+                {"$set": {"load": load, "heartbeat_at": now, "expires_at": now + timedelta(seconds=lease_seconds)}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Error recording instance heartbeat: {e}")
+
+    async def count_live_instances(self):
+        try:
+            return await self.db.instances.count_documents({"expires_at": {"$gt": datetime.utcnow()}})
+        except Exception as e:
+            logger.error(f"Error counting instances: {e}")
+            return 1
+
+    async def remove_instance(self, instance_id):
+        try:
+            await self.db.instances.delete_one({"_id": instance_id})
+        except Exception as e:
+            logger.error(f"Error removing instance: {e}")
+
+    # Task Control
+    def watch_task_controls(self, fields, resume_after=None):
+        """Change stream of task updates that touch any of fields"""
+        pattern = "^(" + "|".join(fields) + ")(\\.|$)"
+        pipeline = [{"$match": {"$or": [
+            {"operationType": "replace"},
+            {"operationType": "update", "$expr": {"$gt": [
+                {"$size": {"$filter": {
+                    "input": {"$objectToArray": "$updateDescription.updatedFields"},
+                    "cond": {"$regexMatch": {"input": "$$this.k", "regex": pattern}}
+                }}},
+                0
+            ]}}
+        ]}}]
+        return self.db.tasks.watch(pipeline, full_document="updateLookup", resume_after=resume_after)
+
+    async def get_task_controls(self, task_ids, fields):
+        """Read only the control fields of the given tasks"""
+        try:
+            cursor = self.db.tasks.find(
+                {"_id": {"$in": [ObjectId(task_id) for task_id in task_ids]}},
+                {field: 1 for field in fields}
+            )
+            tasks = []
+            async for task in cursor:
+                task["_id"] = str(task["_id"])
+                tasks.append(task)
+            return tasks
+        except Exception as e:
+            logger.error(f"Error getting task controls: {e}")
+            return []
@@ -0,0 +1,137 @@
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta
+import logging
+from config import (
+    DEAD_LETTER_POLL_INTERVAL, DEAD_LETTER_SCAN_LIMIT, DEAD_LETTER_BASE_DELAY,
+    DEAD_LETTER_MAX_DELAY, DEAD_LETTER_MAX_ATTEMPTS, MAX_FORWARD_BATCH
+)
+from utils import ErrorHandler, ErrorClass
+
+logger = logging.getLogger(__name__)
+
+def backoff_until(attempts):
+    """Exponential backoff from now for an entry that has failed attempts times"""
+    delay = min(DEAD_LETTER_BASE_DELAY * 2 ** attempts, DEAD_LETTER_MAX_DELAY)
+    return datetime.utcnow() + timedelta(seconds=delay)
+
+def next_retry_at(attempts, error_class):
+    """When to try again after attempts failures, or None once retries are used up"""
+    if attempts >= DEAD_LETTER_MAX_ATTEMPTS.get(error_class, 1):
+        return None
+    return backoff_until(attempts)
+
+async def add_dead_letters(db, task_id, source_channel, dest_channel, message_ids, error_class, error):
+    """Queue messages that failed to send for a later retry"""
+    retry_at = next_retry_at(0, error_class)
+    await db.add_dead_letters([
+        {
+            "task_id": task_id,
+            "source_channel": source_channel,
+            "dest_channel": dest_channel,
+            "message_id": message_id,
+            "error_class": error_class,
+            "error": error,
+            "next_retry_at": retry_at
+        }
+        for message_id in message_ids
+    ])
+
+class DeadLetterScheduler:
+    """Retries dead-lettered messages while their account has idle capacity
+    
+    Due entries are read by next_retry_at and re-sent per task and
+    destination in batches of up to MAX_FORWARD_BATCH. A batch only goes
+    out when the account's rate bucket is full, so retries never slow down
+    running tasks.
+    """
+    
+    def __init__(self, db, task_manager):
+        self.db = db
+        self.task_manager = task_manager
+        self._loop = None
+    
+    def start(self):
+        if self._loop is None or self._loop.done():
+            self._loop = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._loop is not None:
+            self._loop.cancel()
+            self._loop = None
+    
+    async def _run(self):
+        while True:
+            try:
+                await self.retry_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error retrying dead letters: {e}")
+            await asyncio.sleep(DEAD_LETTER_POLL_INTERVAL)
+    
+    async def retry_due(self):
+        """Retry every due entry whose account is idle"""
+        due = await self.db.get_due_dead_letters(datetime.utcnow(), DEAD_LETTER_SCAN_LIMIT)
+        groups = defaultdict(list)
+        for entry in due:
+            groups[(entry["task_id"], entry["dest_channel"])].append(entry)
+        
+        for (task_id, dest_channel), entries in groups.items():
+            task = await self.db.get_task(task_id)
+            if not task or task.get("status") in ("STOPPED", "DELETED"):
+                await self.db.delete_dead_letters([entry["_id"] for entry in entries])
+                continue
+            if task.get("status") == "PAUSED":
+                await self.defer(entries)
+                continue
+            
+            engine = await self.task_manager.get_retry_engine(task)
+            if engine is None:
+                await self.defer(entries)
+                continue
+            for start in range(0, len(entries), MAX_FORWARD_BATCH):
+                if not engine.rate_limiter.has_idle_capacity() or (await engine.get_breaker(dest_channel)).is_open:
+                    await self.defer(entries[start:])
+                    break
+                await self.retry(engine, task, dest_channel, entries[start:start + MAX_FORWARD_BATCH])
+        
+        self.task_manager.prune_retry_engines({task_id for task_id, _ in groups})
+    
+    async def defer(self, entries):
+        """Push skipped entries back so they don't fill every scan; not counted as attempts"""
+        await self.db.update_dead_letters([
+            (entry["_id"], {"next_retry_at": backoff_until(entry.get("attempts", 0))})
+            for entry in entries
+        ])
+    
+    async def retry(self, engine, task, dest_channel, entries):
+        """Re-send one batch and reschedule whatever still fails"""
+        task_id = task["_id"]
+        message_ids = [entry["message_id"] for entry in entries]
+        error_class, error = ErrorClass.SKIP, "Not forwarded on retry"
+        try:
+            results = await engine.retry_dead_letters(task_id, task["source_channel"], dest_channel, message_ids)
+        except Exception as e:
+            results = {}
+            error_class, error = ErrorHandler.classify(e.__cause__ or e), str(e)
+        
+        delivered = [entry for entry in entries if results.get(entry["message_id"]) is not None]
+        if delivered:
+            await self.db.delete_dead_letters([entry["_id"] for entry in delivered])
+            # Engines $set forwarded_count absolutely, so retries count in a field of their own
+            self.task_manager.checkpointer.increment(task_id, {"progress.retried_count": len(delivered)})
+            logger.info(f"Task {task_id}: {len(delivered)} dead-lettered messages delivered")
+        
+        updates = []
+        for entry in entries:
+            if results.get(entry["message_id"]) is not None:
+                continue
+            attempts = entry.get("attempts", 0) + 1
+            updates.append((entry["_id"], {
+                "attempts": attempts,
+                "error_class": error_class,
+                "error": error,
+                "next_retry_at": next_retry_at(attempts, error_class)
+            }))
+        await self.db.update_dead_letters(updates)
@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import math
+import re
+import time
+from collections import OrderedDict
+import logging
+from config import (
+    DEDUPE_CAPACITY, DEDUPE_INITIAL_CAPACITY, DEDUPE_ERROR_RATE, DEDUPE_LRU_SIZE, DEDUPE_SAVE_INTERVAL
+)
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE = re.compile(r"\s+")
+
+class BloomFilter:
+    """Fixed-size Bloom filter over 16-byte digests"""
+    
+    def __init__(self, capacity, error_rate, bits=None, count=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(bits) if bits else bytearray((self.size + 7) // 8)
+        self.count = count
+    
+    def _positions(self, digest):
+        # Double hashing: k positions from two 64-bit halves of the digest
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:16], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+    
+    def add(self, digest):
+        for position in self._positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+    
+    def __contains__(self, digest):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(digest))
+    
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+class ContentDeduplicator:
+    """Drops messages whose content was already sent to a destination
+    
+    Normalized text and media IDs are hashed; recent hashes are kept
+    exactly in an LRU and everything else in Bloom filter generations.
+    The first generation is small and each new one doubles, with half the
+    error rate of the one before, until DEDUPE_CAPACITY; from then on the
+    oldest generations age out, so memory stays bounded and quiet
+    destinations stay small. State is shared by every task writing to the
+    destination.
+    """
+    
+    # One deduplicator per destination, shared across tasks and sources
+    _shared = {}
+    
+    def __init__(self, db, dest_channel, capacity=DEDUPE_CAPACITY, error_rate=DEDUPE_ERROR_RATE, lru_size=DEDUPE_LRU_SIZE, initial_capacity=DEDUPE_INITIAL_CAPACITY):
+        self.db = db
+        self.dest_channel = dest_channel
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.lru_size = lru_size
+        # Oldest first; the last generation takes new hashes
+        self.generations = [BloomFilter(min(initial_capacity, capacity), error_rate / 2)]
+        self.recent = OrderedDict()
+        # Digests of content being sent right now, by any task
+        self.reserved = set()
+        self.dirty = False
+        self.last_save = time.monotonic()
+        self._loading = None
+    
+    @classmethod
+    async def shared(cls, db, dest_channel):
+        """Get the process-wide deduplicator for a destination, loading it once"""
+        deduplicator = cls._shared.get(dest_channel)
+        if deduplicator is None:
+            # Registered before the load, so concurrent callers share one instance
+            deduplicator = cls(db, dest_channel)
+            cls._shared[dest_channel] = deduplicator
+            deduplicator._loading = asyncio.ensure_future(deduplicator.load())
+        await asyncio.shield(deduplicator._loading)
+        return deduplicator
+    
+    @property
+    def current(self):
+        return self.generations[-1]
+    
+    @staticmethod
+    def fingerprint(message):
+        """Hash a message's normalized text and media ID, or None if it has neither"""
+        parts = []
+        text = WHITESPACE.sub(" ", message.message or "").strip().casefold()
+        if text:
+            parts.append(f"t:{text}")
+        media = getattr(message, "photo", None) or getattr(message, "document", None)
+        if media is not None:
+            parts.append(f"m:{media.id}")
+        if not parts:
+            return None
+        return hashlib.blake2b("\n".join(parts).encode(), digest_size=16).digest()
+    
+    def seen(self, digest):
+        if digest in self.recent:
+            self.recent.move_to_end(digest)
+            return True
+        return any(digest in generation for generation in self.generations)
+    
+    def add(self, digest):
+        self.recent[digest] = None
+        if len(self.recent) > self.lru_size:
+            self.recent.popitem(last=False)
+        if digest in self.current:
+            return
+        if self.current.full:
+            self.rotate()
+        self.current.add(digest)
+        self.dirty = True
+    
+    def rotate(self):
+        """Start a new generation instead of letting the error rate climb"""
+        last = self.current
+        if last.capacity < self.capacity:
+            # Growing: halving error rates keep the summed rate near error_rate
+            self.generations.append(BloomFilter(min(last.capacity * 2, self.capacity), last.error_rate / 2))
+        else:
+            self.generations.append(BloomFilter(self.capacity, self.error_rate / 2))
+        # Keep at least capacity hashes of history behind the new generation
+        while sum(generation.capacity for generation in self.generations[1:-1]) >= self.capacity:
+            self.generations.pop(0)
+    
+    def filter_new(self, messages):
+        """Drop content already delivered, being sent by another task, or repeated in the batch
+        
+        Returns (kept messages, {message_id: digest}). The digests stay
+        reserved until they are passed back to record().
+        """
+        kept = []
+        digests = {}
+        for message in messages:
+            digest = self.fingerprint(message)
+            if digest is not None:
+                if digest in self.reserved or self.seen(digest):
+                    continue
+                self.reserved.add(digest)
+                digests[message.id] = digest
+            kept.append(message)
+        return kept, digests
+    
+    async def record(self, digests, results=None):
+        """Release a batch's reservations and remember the content that was delivered
+        
+        results maps source message IDs of the same batch to the forwarded
+        message, or None; without results nothing is remembered.
+        """
+        results = results or {}
+        for message_id, digest in digests.items():
+            self.reserved.discard(digest)
+            if results.get(message_id) is not None:
+                self.add(digest)
+        await self.save()
+    
+    async def load(self):
+        """Restore the filters saved before the last restart"""
+        state = await self.db.get_dedupe_state(self.dest_channel)
+        if not state or state.get("capacity") != self.capacity or state.get("error_rate") != self.error_rate:
+            return
+        generations = state.get("generations")
+        if generations is None:
+            # Saved before filters grew: full-size current and previous generations
+            generations = [
+                {"capacity": self.capacity, "error_rate": self.error_rate, "bits": bits, "count": count}
+                for bits, count in ((state.get("previous"), self.capacity), (state.get("current"), state.get("current_count", 0)))
+                if bits
+            ]
+        if generations:
+            self.generations = [
+                BloomFilter(generation["capacity"], generation["error_rate"], generation["bits"], generation["count"])
+                for generation in generations
+            ]
+        for digest in state.get("recent", []):
+            self.recent[bytes(digest)] = None
+        logger.info(f"Loaded dedupe state for {self.dest_channel}: {sum(g.count for g in self.generations)} hashes")
+    
+    async def save(self, force=False):
+        """Persist the filters, at most every DEDUPE_SAVE_INTERVAL"""
+        now = time.monotonic()
+        if not self.dirty or (not force and now - self.last_save < DEDUPE_SAVE_INTERVAL):
+            return
+        self.last_save = now
+        self.dirty = False
+        await self.db.save_dedupe_state(self.dest_channel, {
+            "capacity": self.capacity,
+            "error_rate": self.error_rate,
+            "generations": [
+                {
+                    "capacity": generation.capacity,
+                    "error_rate": generation.error_rate,
+                    "bits": bytes(generation.bits),
+                    "count": generation.count
+                }
+                for generation in self.generations
+            ],
+            "recent": list(self.recent)
+        })
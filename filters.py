@@ -0,0 +1,162 @@
+import re
+from collections import deque
+from datetime import datetime, timezone
+import logging
+from utils import TaskFatalError
+
+logger = logging.getLogger(__name__)
+
+INCLUDE = 1
+EXCLUDE = 2
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton matching many keywords in one pass over the text"""
+    
+    def __init__(self, keywords):
+        # keywords: {keyword: flag}; flags of all keywords ending at a node are OR-ed
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [0]
+        for keyword, flag in keywords.items():
+            node = 0
+            for char in keyword:
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][char] = next_node
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(0)
+                node = next_node
+            self.output[node] |= flag
+        
+        # Breadth-first fail links; outputs inherit from their fail node
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] |= self.output[self.fail[child]]
+    
+    def scan(self, text, stop_on=0):
+        """Return the OR of flags of every keyword in text
+        
+        Stops early once all bits in stop_on are found.
+        """
+        found = 0
+        node = 0
+        goto, fail, output = self.goto, self.fail, self.output
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found |= output[node]
+                if stop_on and found & stop_on == stop_on:
+                    break
+        return found
+
+def combine_patterns(patterns):
+    """Compile a list of regexes into one alternation, or None"""
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.IGNORECASE)
+
+def media_type(message):
+    """Classify a message by its content"""
+    if message.media is None:
+        return "text"
+    for kind in ("photo", "sticker", "gif", "voice", "video_note", "video", "audio", "poll", "geo", "contact", "web_preview", "document"):
+        if getattr(message, kind, None):
+            return kind
+    return "other"
+
+def parse_date(value):
+    """Accept a datetime or ISO string; naive values are taken as UTC"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+class MessageFilter:
+    """A task's filter rules, compiled once and checked before any API call
+    
+    Rules come from the task's "filters" field:
+    include_keywords / exclude_keywords, include_patterns / exclude_patterns,
+    media_types, min_date / max_date, min_id / max_id, senders and
+    exclude_senders. With no rules every non-service message passes.
+    """
+    
+    def __init__(self, rules=None):
+        rules = rules or {}
+        self.rules = rules
+        keywords = {}
+        for keyword in rules.get("include_keywords", []):
+            keywords[keyword.casefold()] = keywords.get(keyword.casefold(), 0) | INCLUDE
+        for keyword in rules.get("exclude_keywords", []):
+            keywords[keyword.casefold()] = keywords.get(keyword.casefold(), 0) | EXCLUDE
+        self.keywords = KeywordAutomaton(keywords) if keywords else None
+        self.has_include_keywords = bool(rules.get("include_keywords"))
+        self.include_pattern = combine_patterns(rules.get("include_patterns"))
+        self.exclude_pattern = combine_patterns(rules.get("exclude_patterns"))
+        self.media_types = set(rules.get("media_types") or [])
+        self.min_date = parse_date(rules.get("min_date"))
+        self.max_date = parse_date(rules.get("max_date"))
+        self.min_id = rules.get("min_id") or 0
+        self.max_id = rules.get("max_id") or 0
+        self.senders = set(rules.get("senders") or [])
+        self.exclude_senders = set(rules.get("exclude_senders") or [])
+    
+    @classmethod
+    def from_task(cls, task):
+        """Compile the task's rules; invalid rules raise TaskFatalError
+        
+        Failing closed: forwarding unfiltered would send exactly what the
+        rules exist to hold back.
+        """
+        rules = (task or {}).get("filters")
+        try:
+            return cls(rules)
+        except (re.error, ValueError, TypeError, AttributeError) as e:
+            raise TaskFatalError(f"Invalid filter rules: {e}") from e
+    
+    def past_end(self, message):
+        """True once an oldest-first scan has passed max_id"""
+        return bool(self.max_id) and message.id > self.max_id
+    
+    def matches(self, message):
+        """Cheapest checks first; text is scanned at most once per matcher"""
+        if message is None or getattr(message, "action", None) is not None:
+            return False
+        if message.id < self.min_id or (self.max_id and message.id > self.max_id):
+            return False
+        if self.min_date and message.date and message.date < self.min_date:
+            return False
+        if self.max_date and message.date and message.date > self.max_date:
+            return False
+        if self.senders and message.sender_id not in self.senders:
+            return False
+        if message.sender_id in self.exclude_senders:
+            return False
+        if self.media_types and media_type(message) not in self.media_types:
+            return False
+        
+        text = message.message or ""
+        if self.keywords is not None:
+            found = self.keywords.scan(text.casefold(), stop_on=EXCLUDE)
+            if found & EXCLUDE:
+                return False
+            if self.has_include_keywords and not found & INCLUDE:
+                return False
+        if self.exclude_pattern is not None and self.exclude_pattern.search(text):
+            return False
+        if self.include_pattern is not None and not self.include_pattern.search(text):
+            return False
+        return True
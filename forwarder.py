@@ -1,59 +1,315 @@
 import asyncio
 import random
-from collections import deque
-from datetime import datetime, timedelta
-from telethon.errors import FloodWaitError
+import time
+from datetime import datetime
+from telethon import events
+from telethon.extensions import html
+from telethon.errors import FloodWaitError, ChatForwardsRestrictedError
+from telethon.tl.functions.messages import ForwardMessagesRequest
 import logging
-from config import RATE_LIMITS, MAX_RETRIES
+from checkpointer import ProgressCheckpointer
+from utils import ErrorHandler, ErrorClass, TaskFatalError
+from message_map import MessageMap, content_digest, edited_at
+from deadletter import add_dead_letters
+from dedupe import ContentDeduplicator
+from filters import MessageFilter
+from rewriter import RewritePipeline
+from media import MediaReuploader, has_uploadable_media
+from runtime import CancelToken, TaskCancelled
+from config import (
+    RATE_LIMITS, MAX_RETRIES, MAX_FORWARD_BATCH, PROGRESS_UPDATE_BATCH,
+    TOTAL_COUNT_REFRESH_INTERVAL, LEARNED_RATE_SAVE_INTERVAL, LIVE_CATCHUP_MAX_MESSAGES,
+    FANOUT_QUEUE_BATCHES, ACCOUNT_FAILOVER_FLOOD_SECONDS, SHARD_PREFETCH_BATCHES,
+    PIPELINE_FETCH_AHEAD, PIPELINE_RECORD_QUEUE, LIVE_SYNC_WINDOW, DEDUPE_ENABLED,
+    LIVE_ALBUM_WINDOW, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_COOLDOWN, CIRCUIT_MAX_COOLDOWN,
+    CIRCUIT_POLL_INTERVAL
+)
 
 logger = logging.getLogger(__name__)
 
+class AccountFloodLimited(Exception):
+    """Raised when an account is flood-limited long enough to move its tasks"""
+    
+    def __init__(self, account_key, seconds):
+        super().__init__(f"Account {account_key} flood-limited for {seconds}s")
+        self.account_key = account_key
+        self.seconds = seconds
+
+class DestinationUnavailable(TaskFatalError):
+    """Raised when a destination refuses posts or its circuit is open"""
+
+class MessageRejected(Exception):
+    """Raised when Telegram rejects the content of a send request"""
+
+class CircuitBreaker:
+    """Stops sending to a destination that keeps failing
+    
+    Opens after CIRCUIT_FAILURE_THRESHOLD consecutive failures. While open,
+    tasks sending there wait without spending rate budget; after the
+    cooldown a single request probes the destination (half-open). Success
+    closes the circuit, failure re-opens it with a doubled cooldown.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    # One breaker per destination peer, shared by every task sending there
+    _shared = {}
+    
+    def __init__(self, dest_key):
+        self.dest_key = dest_key
+        self.state = self.CLOSED
+        self.failures = 0
+        self.cooldown = CIRCUIT_COOLDOWN
+        self.reopen_at = 0.0
+        self.closed = asyncio.Event()
+        self.closed.set()
+    
+    @classmethod
+    def shared(cls, dest_key):
+        """Get the process-wide breaker for a destination"""
+        breaker = cls._shared.get(dest_key)
+        if breaker is None:
+            breaker = cls(dest_key)
+            cls._shared[dest_key] = breaker
+        return breaker
+    
+    @property
+    def is_open(self):
+        return self.state != self.CLOSED
+    
+    async def acquire(self, engine):
+        """Wait until a request may go out: the circuit is closed or this caller probes it"""
+        while not self.closed.is_set():
+            if engine.stopped:
+                raise TaskCancelled()
+            now = time.monotonic()
+            if self.state == self.OPEN and now >= self.reopen_at:
+                self.state = self.HALF_OPEN
+                logger.info(f"Circuit for {self.dest_key} half-open, probing")
+                return
+            timeout = CIRCUIT_POLL_INTERVAL
+            if self.state == self.OPEN:
+                timeout = max(0.1, min(self.reopen_at - now, timeout))
+            try:
+                await asyncio.wait_for(self.closed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+    
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info(f"Circuit for {self.dest_key} closed")
+        self.state = self.CLOSED
+        self.failures = 0
+        self.cooldown = CIRCUIT_COOLDOWN
+        self.closed.set()
+    
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN:
+            self.cooldown = min(self.cooldown * 2, CIRCUIT_MAX_COOLDOWN)
+        elif self.failures < CIRCUIT_FAILURE_THRESHOLD:
+            return
+        self.state = self.OPEN
+        self.reopen_at = time.monotonic() + self.cooldown
+        self.closed.clear()
+        logger.warning(f"Circuit for {self.dest_key} open for {self.cooldown}s after {self.failures} failures")
+    
+    def release_probe(self):
+        """Let another caller probe when the probe ended without an answer"""
+        if self.state == self.HALF_OPEN:
+            self.state = self.OPEN
+            self.reopen_at = time.monotonic()
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate_per_minute"""
+    
+    def __init__(self, rate_per_minute, capacity):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def reserve(self, tokens=1):
+        """Take tokens now and return how long the caller must wait for them"""
+        # Tokens may go negative: later callers queue behind earlier
+        # reservations without any lock or waiter list
+        self._refill()
+        self.tokens -= tokens
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+    
+    def set_rate(self, rate_per_minute):
+        """Change the refill rate, keeping tokens earned so far"""
+        self._refill()
+        self.rate = rate_per_minute / 60.0
+    
+    async def acquire(self, tokens=1):
+        """Wait until tokens are available"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+    
+    def available(self):
+        """Tokens that could be taken right now without waiting"""
+        self._refill()
+        return self.tokens
+    
+    def penalize(self, seconds):
+        """Block every caller sharing this bucket for the given seconds"""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+class ForwardCounter:
+    """Sliding one-minute forward count kept in per-second buckets"""
+    
+    def __init__(self, window=60):
+        self.window = window
+        self.counts = [0] * window
+        self.seconds = [0] * window
+    
+    def add(self, count=1):
+        now = int(time.monotonic())
+        slot = now % self.window
+        if self.seconds[slot] != now:
+            self.seconds[slot] = now
+            self.counts[slot] = 0
+        self.counts[slot] += count
+    
+    def total(self):
+        cutoff = int(time.monotonic()) - self.window
+        return sum(count for second, count in zip(self.seconds, self.counts) if second > cutoff)
+
 class RateLimiter:
-    def __init__(self, auth_method):
+    # One limiter per account, shared by every engine and task using it
+    _shared = {}
+    
+    def __init__(self, auth_method, account_key=None, db=None):
         self.auth_method = auth_method
+        self.account_key = account_key or auth_method
         self.config = RATE_LIMITS[auth_method]
-        self.forwards_this_minute = deque(maxlen=60)
+        self.db = db
+        self.rate_per_minute = self.config["max_forwards_per_minute"]
+        self.bucket = TokenBucket(self.rate_per_minute, self.config["burst"])
+        self.forward_counter = ForwardCounter()
         self.last_backoff_time = None
         self.backoff_multiplier = 1.0
+        self.flooded_until = 0.0
+        
+        # Adaptive (AIMD) state
+        self.adaptive = self.config.get("adaptive", False)
+        self.successes_since_increase = 0
+        self.learned_rate_loaded = False
+        self.last_rate_save = 0.0
+    
+    @classmethod
+    def shared(cls, auth_method, account_key=None, db=None):
+        """Get the process-wide limiter for an account"""
+        key = account_key or auth_method
+        limiter = cls._shared.get(key)
+        if limiter is None:
+            limiter = cls(auth_method, key, db)
+            cls._shared[key] = limiter
+        elif limiter.db is None:
+            limiter.db = db
+        return limiter
+    
+    def set_rate(self, rate_per_minute):
+        """Clamp and apply a new forwards-per-minute rate"""
+        floor = self.config.get("min_forwards_per_minute", 1)
+        ceiling = self.config.get("ceiling_forwards_per_minute", self.config["max_forwards_per_minute"])
+        self.rate_per_minute = max(floor, min(rate_per_minute, ceiling))
+        self.bucket.set_rate(self.rate_per_minute)
+    
+    async def load_learned_rate(self):
+        """Start from the rate learned before the last restart"""
+        self.learned_rate_loaded = True
+        if not self.adaptive or self.db is None:
+            return
+        rate = await self.db.get_learned_rate(self.account_key)
+        if rate:
+            self.set_rate(rate)
+            logger.info(f"Loaded learned rate for {self.account_key}: {self.rate_per_minute:.1f}/min")
+    
+    async def save_learned_rate(self, force=False):
+        """Persist the learned rate, at most every LEARNED_RATE_SAVE_INTERVAL"""
+        if not self.adaptive or self.db is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_rate_save < LEARNED_RATE_SAVE_INTERVAL:
+            return
+        self.last_rate_save = now
+        await self.db.save_learned_rate(self.account_key, self.rate_per_minute)
+    
+    async def record_success(self):
+        """Additive increase: probe upward after a run of successful requests"""
+        if not self.adaptive:
+            return
+        self.successes_since_increase += 1
+        if self.successes_since_increase < self.config["aimd_increase_every"]:
+            return
+        self.successes_since_increase = 0
+        self.set_rate(self.rate_per_minute + self.config["aimd_increase"])
+        await self.save_learned_rate()
+    
+    async def record_flood(self):
+        """Multiplicative decrease: cut the rate sharply on FloodWait"""
+        if not self.adaptive:
+            return
+        self.successes_since_increase = 0
+        self.set_rate(self.rate_per_minute * self.config["aimd_decrease"])
+        logger.warning(f"Adaptive rate for {self.account_key} cut to {self.rate_per_minute:.1f}/min")
+        await self.save_learned_rate(force=True)
     
     async def record_forward(self):
         """Record a forward attempt"""
-        self.forwards_this_minute.append(datetime.now())
+        self.forward_counter.add()
     
     def get_forwards_per_minute(self):
         """Get forwards in last minute"""
-        now = datetime.now()
-        cutoff = now - timedelta(seconds=60)
-        return sum(1 for t in self.forwards_this_minute if t > cutoff)
+        return self.forward_counter.total()
     
     async def wait_before_forward(self):
-        """Wait with intelligent rate limiting"""
+        """Wait for a token from the account-wide bucket"""
         try:
-            forwards_per_min = self.get_forwards_per_minute()
-            max_per_min = self.config["max_forwards_per_minute"]
-            
-            base_delay = self.config["base_delay"]
+            if not self.learned_rate_loaded:
+                await self.load_learned_rate()
             
-            # If approaching rate limit, increase delay
-            if forwards_per_min > max_per_min * 0.8:
-                base_delay *= 1.5
-                logger.warning(f"Rate limit approaching for {self.auth_method}: {forwards_per_min}/{max_per_min}")
+            await self.bucket.acquire()
             
             # Add randomness to avoid detection
-            jitter = random.uniform(-0.05, 0.05)
-            total_delay = base_delay + jitter
-            total_delay = max(self.config["min_delay"], min(total_delay, self.config["max_delay"]))
-            
-            await asyncio.sleep(total_delay)
+            await asyncio.sleep(random.uniform(0, 0.05))
             await self.record_forward()
         except Exception as e:
             logger.error(f"Error in rate limiter: {e}")
             await asyncio.sleep(self.config["base_delay"])
     
+    def is_healthy(self):
+        """Whether the account is free of a pending flood wait"""
+        return time.monotonic() >= self.flooded_until
+    
+    def has_idle_capacity(self):
+        """True when no task has used the bucket lately, so spare work may run"""
+        return self.is_healthy() and self.bucket.available() >= self.bucket.capacity
+    
+    async def mark_flood_limited(self, wait_seconds):
+        """Record a flood wait against the account without sleeping"""
+        self.last_backoff_time = datetime.now()
+        self.flooded_until = max(self.flooded_until, time.monotonic() + wait_seconds)
+        self.bucket.penalize(wait_seconds)
+        await self.record_flood()
+    
     async def handle_flood_wait(self, wait_seconds):
         """Handle Telegram flood wait"""
         try:
-            logger.warning(f"Rate limited! Waiting {wait_seconds}s for {self.auth_method}")
+            logger.warning(f"Rate limited! Waiting {wait_seconds}s for {self.account_key}")
+            await self.mark_flood_limited(wait_seconds)
             await asyncio.sleep(wait_seconds)
             self.backoff_multiplier = 1.0
         except Exception as e:
@@ -65,125 +321,1245 @@ class RateLimiter:
         return min(backoff_time, 300)  # Cap at 5 minutes
 
 class ForwardingEngine:
-    def __init__(self, client, auth_method, db):
+    def __init__(self, client, auth_method, db, account_key=None, failover=False, checkpointer=None, runtime=None):
         self.client = client
         self.auth_method = auth_method
-        self.rate_limiter = RateLimiter(auth_method)
+        self.account_key = account_key or auth_method
+        self.rate_limiter = RateLimiter.shared(auth_method, self.account_key, db=db)
+        # With failover, long flood waits raise AccountFloodLimited instead of sleeping
+        self.failover = failover
         self.db = db
+        # Progress goes through the write-behind checkpointer, not inline Mongo writes
+        self.checkpointer = checkpointer or ProgressCheckpointer(db)
+        self.batch_size = min(self.rate_limiter.config["batch_size"], MAX_FORWARD_BATCH)
+        
+        # In-memory task control, so the forward loop never polls Mongo;
+        # a task's engines share its runtime's pause Event and cancel token
+        if runtime is not None:
+            self.running, self.token = runtime.running, runtime.token
+        else:
+            self.running, self.token = asyncio.Event(), CancelToken()
+            self.running.set()
+        self.live_queue = None
+        # The running task's compiled rules, checked as messages are fetched
+        self.filters = MessageFilter()
+        # Copy mode: messages are re-sent through this pipeline instead of forwarded
+        self.rewrite = None
+        # Protected sources: copy, re-uploading media instead of sending it by reference
+        self.restricted = False
+        self.media = MediaReuploader(client)
+        self.peer_ids = {}
+    
+    def pause(self):
+        """Hold forwarding until resume() is called"""
+        self.running.clear()
+    
+    def resume(self):
+        """Continue a paused engine"""
+        self.running.set()
     
-    async def forward_message(self, source_channel, dest_channel, message_id):
-        """Forward single message with retry logic"""
+    def stop(self):
+        """Stop the engine at the next message"""
+        self.token.cancel()
+        self.running.set()
+        if self.live_queue is not None:
+            self.live_queue.put_nowait(None)
+    
+    @property
+    def stopped(self):
+        return self.token.cancelled
+    
+    async def wait_if_paused(self):
+        """Batch boundary: hold while paused and raise TaskCancelled once stopped"""
+        await self.running.wait()
+        if self.stopped:
+            raise TaskCancelled()
+    
+    async def send_with_retry(self, send, dest_channel, what):
+        """Run one send request under the rate limiter, retrying what can be retried
+        
+        FloodWaits are slept off, or raise AccountFloodLimited with failover.
+        Destination and fatal errors raise at once, rejected content raises
+        MessageRejected, and other errors are retried with backoff and
+        re-raised after MAX_RETRIES attempts.
+        """
         for attempt in range(MAX_RETRIES):
             try:
                 await self.rate_limiter.wait_before_forward()
                 
-                result = await self.client.forward_messages(dest_channel, message_id, source_channel)
-                logger.debug(f"Message {message_id} forwarded successfully")
+                result = await send()
+                await self.rate_limiter.record_success()
                 return result
             
             except FloodWaitError as e:
+                if self.failover and e.seconds >= ACCOUNT_FAILOVER_FLOOD_SECONDS:
+                    await self.rate_limiter.mark_flood_limited(e.seconds)
+                    raise AccountFloodLimited(self.account_key, e.seconds)
                 await self.rate_limiter.handle_flood_wait(e.seconds)
+                if attempt == MAX_RETRIES - 1:
+                    logger.error(f"{what} still flood-limited after {MAX_RETRIES} attempts")
+                    raise
                 backoff = await self.rate_limiter.exponential_backoff(attempt)
-                logger.warning(f"FloodWait for {self.auth_method}, retrying in {backoff}s")
+                logger.warning(f"FloodWait for {self.account_key}, retrying {what} in {backoff}s")
                 await asyncio.sleep(backoff)
             
+            except ChatForwardsRestrictedError:
+                raise
+            
             except Exception as e:
-                if attempt < MAX_RETRIES - 1:
-                    backoff = await self.rate_limiter.exponential_backoff(attempt)
-                    logger.warning(f"Forward failed (attempt {attempt+1}), retrying: {e}")
-                    await asyncio.sleep(backoff)
-                else:
-                    logger.error(f"Forward failed after {MAX_RETRIES} attempts: {e}")
+                error_class = ErrorHandler.classify(e)
+                if error_class == ErrorClass.DESTINATION:
+                    raise DestinationUnavailable(f"{dest_channel} refused the message: {e}") from e
+                if error_class == ErrorClass.FATAL:
+                    raise TaskFatalError(f"Sending stopped: {e}") from e
+                if error_class == ErrorClass.SKIP:
+                    raise MessageRejected(str(e)) from e
+                if attempt == MAX_RETRIES - 1:
+                    logger.error(f"{what} failed after {MAX_RETRIES} attempts: {e}")
                     raise
+                backoff = await self.rate_limiter.exponential_backoff(attempt)
+                logger.warning(f"{what} failed (attempt {attempt+1}), retrying: {e}")
+                await asyncio.sleep(backoff)
+    
+    @staticmethod
+    def group_message_ids(message_ids, batch_size=MAX_FORWARD_BATCH):
+        """Split message IDs into ordered groups of consecutive IDs"""
+        groups = []
+        current = []
+        for message_id in sorted(set(message_ids)):
+            if len(current) >= batch_size:
+                groups.append(current)
+                current = []
+            current.append(message_id)
+        if current:
+            groups.append(current)
+        return groups
+    
+    async def forward_without_author(self, source_channel, dest_channel, message_ids):
+        """Forward without the "Forwarded from" header, so messages arrive as copies
+        
+        Telethon's forward_messages has no drop_author, so this sends the
+        raw request and maps the results the same way it does.
+        """
+        to_peer = await self.client.get_input_entity(dest_channel)
+        request = ForwardMessagesRequest(
+            from_peer=await self.client.get_input_entity(source_channel),
+            id=message_ids, to_peer=to_peer, drop_author=True
+        )
+        result = await self.client(request)
+        return self.client._get_response_message(request, result, to_peer)
+    
+    async def forward_batch(self, source_channel, dest_channel, message_ids, drop_author=False):
+        """Forward up to MAX_FORWARD_BATCH messages in one request
+        
+        Returns a dict mapping each source message ID to the forwarded
+        message, or None if Telegram did not forward it. With drop_author
+        the messages arrive without the forward header.
+        """
+        message_ids = list(message_ids)[:MAX_FORWARD_BATCH]
+        if not message_ids:
+            return {}
+        
+        if drop_author:
+            send = lambda: self.forward_without_author(source_channel, dest_channel, message_ids)
+        else:
+            send = lambda: self.client.forward_messages(dest_channel, message_ids, source_channel)
+        try:
+            results = await self.send_with_retry(send, dest_channel, "Batch forward")
+        except MessageRejected as e:
+            if len(message_ids) == 1:
+                logger.warning(f"Skipping message {message_ids[0]}: {e}")
+                return {message_ids[0]: None}
+            # One bad message rejects the whole request: halve until it's isolated
+            logger.warning(f"Batch of {len(message_ids)} rejected ({e}), splitting it")
+            middle = len(message_ids) // 2
+            mapped = await self.forward_batch(source_channel, dest_channel, message_ids[:middle], drop_author)
+            mapped.update(await self.forward_batch(source_channel, dest_channel, message_ids[middle:], drop_author))
+            return mapped
+        
+        if not isinstance(results, list):
+            results = [results]
+        
+        # Telethon returns results aligned with the requested IDs,
+        # with None for messages that were not forwarded
+        mapped = {message_id: None for message_id in message_ids}
+        for message_id, result in zip(message_ids, results):
+            mapped[message_id] = result
+        
+        failed = sum(1 for result in mapped.values() if result is None)
+        logger.debug(f"Batch of {len(message_ids)} forwarded ({failed} failed)")
+        return mapped
+    
+    async def copy_message(self, dest_channel, message, media=None):
+        """Send a rewritten copy of message without the forward header
+        
+        Unless re-uploaded media is given, media is re-sent by file
+        reference, so nothing is downloaded or uploaded.
+        """
+        text, entities = self.rewrite.apply(message.message, message.entities)
+        if media is None:
+            media = None if message.web_preview else message.media
+        if not text and media is None:
+            return None
+        
+        try:
+            result = await self.send_with_retry(
+                lambda: self.client.send_message(
+                    dest_channel, text, formatting_entities=entities, file=media,
+                    link_preview=message.web_preview is not None
+                ),
+                dest_channel, "Copy"
+            )
+        except MessageRejected as e:
+            logger.warning(f"Skipping message {message.id}: {e}")
+            return None
+        logger.debug(f"Message {message.id} copied successfully")
+        return result
+    
+    async def copy_album(self, dest_channel, messages, media):
+        """Send an album as one grouped message with rewritten captions"""
+        captions = []
+        for message in messages:
+            text, entities = self.rewrite.apply(message.message, message.entities)
+            # send_file has no per-item entities for albums, so keep formatting as HTML
+            captions.append(html.unparse(text, entities))
+        
+        try:
+            results = await self.send_with_retry(
+                lambda: self.client.send_file(dest_channel, media, caption=captions, parse_mode="html"),
+                dest_channel, "Album copy"
+            )
+        except MessageRejected as e:
+            logger.warning(f"Skipping album of {len(messages)}: {e}")
+            return {message.id: None for message in messages}
+        if not isinstance(results, list):
+            results = [results]
+        logger.debug(f"Album of {len(messages)} copied successfully")
+        return dict(zip((message.id for message in messages), results))
+    
+    def keeps_content(self, message):
+        """True if the rewrite leaves a message's text and entities as they are"""
+        text, entities = self.rewrite.apply(message.message, message.entities)
+        return text == (message.message or "") and entities == list(message.entities or [])
+    
+    async def copy_batch(self, source_channel, dest_channel, messages):
+        """Copy messages in order; returns the same mapping as forward_batch
+        
+        Runs of messages the rewrite leaves unchanged go out as one forward
+        without the author header, at the cost of a single request. The
+        rest are re-sent one by one, albums as one grouped send. For
+        restricted sources every file in the batch starts re-uploading at
+        once in the background, so text ahead of a large video is sent
+        without waiting for it.
+        """
+        uploads = {}
+        if self.restricted:
+            uploads = {
+                message.id: asyncio.create_task(self.media.reupload(message))
+                for message in messages if has_uploadable_media(message)
+            }
+        
+        async def uploaded_media(message):
+            if self.restricted and message.id not in uploads and has_uploadable_media(message):
+                # Protection turned on mid-batch
+                uploads[message.id] = asyncio.create_task(self.media.reupload(message))
+            if message.id not in uploads:
+                return None
+            try:
+                return await uploads[message.id]
+            except Exception as e:
+                logger.error(f"Re-upload of message {message.id} failed: {e}")
+                return False
+        
+        async def copy_unit(unit):
+            media = [await uploaded_media(message) for message in unit]
+            if len(unit) > 1:
+                album = [
+                    (message, item if item is not None else message.media)
+                    for message, item in zip(unit, media) if item is not False
+                ]
+                results.update({message.id: None for message in unit})
+                if album:
+                    results.update(await self.copy_album(
+                        dest_channel, [message for message, _ in album], [item for _, item in album]
+                    ))
+            elif media[0] is False:
+                results[unit[0].id] = None
+            else:
+                results[unit[0].id] = await self.copy_message(dest_channel, unit[0], media[0])
+        
+        async def send_run():
+            if not run:
+                return
+            unchanged = list(run)
+            run.clear()
+            try:
+                results.update(await self.forward_batch(
+                    source_channel, dest_channel, [message.id for message in unchanged], drop_author=True
+                ))
+            except ChatForwardsRestrictedError:
+                logger.warning(f"{source_channel} restricts forwarding, copying with media re-upload")
+                self.restricted = True
+                for unit in self.group_albums(unchanged):
+                    await copy_unit(unit)
+        
+        results = {}
+        run = []
+        try:
+            for unit in self.group_albums(messages):
+                if not self.restricted and all(self.keeps_content(message) for message in unit):
+                    run.extend(unit)
+                    continue
+                await send_run()
+                await copy_unit(unit)
+            await send_run()
+        finally:
+            for upload in uploads.values():
+                upload.cancel()
+        return results
+    
+    async def get_breaker(self, dest_channel):
+        """Get the circuit breaker for a destination, keyed by its peer ID"""
+        dest_key = self.peer_ids.get(dest_channel)
+        if dest_key is None:
+            try:
+                dest_key = await self.client.get_peer_id(dest_channel)
+            except Exception as e:
+                logger.debug(f"Could not resolve {dest_channel}, keying its circuit by name: {e}")
+                dest_key = dest_channel
+            self.peer_ids[dest_channel] = dest_key
+        return CircuitBreaker.shared(dest_key)
+    
+    async def send_group(self, source_channel, dest_channel, group):
+        """Forward or copy one batch depending on the task's mode"""
+        if self.rewrite is not None:
+            return await self.copy_batch(source_channel, dest_channel, group)
+        try:
+            return await self.forward_batch(source_channel, dest_channel, [message.id for message in group])
+        except ChatForwardsRestrictedError:
+            # The source turned on content protection mid-task
+            logger.warning(f"{source_channel} restricts forwarding, switching to copy with re-upload")
+            self.restricted = True
+            self.rewrite = RewritePipeline()
+            return await self.copy_batch(source_channel, dest_channel, group)
+    
+    async def forward_group(self, source_channel, dest_channel, task_id, group, errors=None, message_map=None, dedupe=None, wait_on_open=True):
+        """Forward one batch of messages, log failures and return the success count
         
-        return None
+        If an errors list is given, failures are appended to it instead of
+        being written to the task's error log. With a message_map, already
+        delivered IDs are skipped but still counted, since a resumed task
+        only re-reads them when their progress was never checkpointed, and
+        new deliveries are recorded; with a
+        dedupe stage, repeated content is dropped before it costs a request.
+        While the destination's circuit is open the batch waits and is
+        retried, or with wait_on_open=False, DestinationUnavailable is raised.
+        """
+        async def report(message):
+            if errors is None:
+                await self.db.add_error_log(task_id, message)
+            else:
+                errors.append(message)
+        
+        delivered = 0
+        if message_map is not None:
+            new = message_map.filter_new(group)
+            delivered = len(group) - len(new)
+            group = new
+        digests = {}
+        if dedupe is not None:
+            group, digests = dedupe.filter_new(group)
+        if not group:
+            return delivered
+        
+        message_ids = [message.id for message in group]
+        breaker = await self.get_breaker(dest_channel)
+        reported = False
+        while True:
+            try:
+                if not wait_on_open and breaker.is_open:
+                    raise DestinationUnavailable(f"Circuit for {dest_channel} is open")
+                await breaker.acquire(self)
+                try:
+                    results = await self.send_group(source_channel, dest_channel, group)
+                except DestinationUnavailable as e:
+                    breaker.record_failure()
+                    if not wait_on_open:
+                        raise
+                    if not reported:
+                        reported = True
+                        await report(f"{e}; waiting for the destination to recover")
+                    logger.warning(f"Batch {message_ids[0]}-{message_ids[-1]} held: {e}")
+                    continue
+                breaker.record_success()
+                break
+            except (AccountFloodLimited, TaskFatalError, asyncio.CancelledError):
+                # No verdict on the destination: let another request probe it
+                breaker.release_probe()
+                if dedupe is not None:
+                    await dedupe.record(digests)
+                raise
+            except Exception as e:
+                if ErrorHandler.classify(e) == ErrorClass.DESTINATION:
+                    breaker.record_failure()
+                else:
+                    # Retryable and skipped errors say nothing about the destination
+                    breaker.release_probe()
+                if dedupe is not None:
+                    await dedupe.record(digests)
+                await add_dead_letters(
+                    self.db, task_id, source_channel, dest_channel, message_ids, ErrorHandler.classify(e), str(e)
+                )
+                await report(str(e))
+                logger.error(f"Error forwarding messages {message_ids[0]}-{message_ids[-1]}: {e}")
+                return delivered
+        
+        if message_map is not None:
+            message_map.record(results, group)
+        if dedupe is not None:
+            await dedupe.record(digests, results)
+        
+        failed = []
+        for message_id, result in results.items():
+            if result is None:
+                failed.append(message_id)
+                await report(f"Message {message_id} was not forwarded")
+                logger.error(f"Error forwarding message {message_id}: not forwarded")
+        if failed:
+            await add_dead_letters(
+                self.db, task_id, source_channel, dest_channel, failed, ErrorClass.SKIP, "Not forwarded"
+            )
+        return delivered + len(results) - len(failed)
+    
+    async def retry_dead_letters(self, task_id, source_channel, dest_channel, message_ids):
+        """Re-send dead-lettered messages in one batch
+        
+        Returns {message_id: result}, with None for messages that failed
+        again or no longer exist. Messages delivered in the meantime count
+        as done.
+        """
+        results = dict.fromkeys(message_ids)
+        delivered = await self.db.get_message_mappings(task_id, dest_channel, message_ids)
+        pending = [message_id for message_id in message_ids if message_id not in delivered]
+        if pending:
+            messages = [message for message in await self.client.get_messages(source_channel, ids=pending) if message]
+            if messages:
+                sent = await self.send_group(source_channel, dest_channel, messages)
+                message_map = MessageMap(self.db, task_id, dest_channel)
+                message_map.record(sent, messages)
+                await message_map.flush()
+                results.update(sent)
+        results.update(delivered)
+        return results
+    
+    async def get_total_count(self, channel):
+        """Get the channel's history size without fetching message bodies"""
+        try:
+            result = await self.client.get_messages(channel, limit=0)
+            return result.total or 0
+        except Exception as e:
+            logger.error(f"Error getting message count for {channel}: {e}")
+            return None
+    
+    async def refresh_total_count(self, channel, task_id):
+        """Probe the history size and store it as the task total"""
+        total = await self.get_total_count(channel)
+        if total is not None:
+            await self.db.update_task_total(task_id, total)
+        return total
     
-    async def get_channel_messages(self, channel, limit=None):
-        """Get messages from channel"""
+    async def is_forward_restricted(self, channel):
+        """Check whether channel has content protection turned on"""
         try:
-            messages = []
-            async for message in self.client.iter_messages(channel, limit=limit, reverse=True):
-                if message and message.text:
-                    messages.append(message)
-            return messages
+            entity = await self.client.get_entity(channel)
+            return bool(getattr(entity, "noforwards", False))
+        except Exception as e:
+            logger.error(f"Error checking forward restriction for {channel}: {e}")
+            return False
+    
+    async def configure(self, task, source_channel, engines=()):
+        """Compile the task's settings once and share them with helper engines"""
+        self.filters = MessageFilter.from_task(task)
+        self.rewrite = RewritePipeline.from_task(task)
+        self.restricted = await self.is_forward_restricted(source_channel)
+        if self.restricted and self.rewrite is None:
+            # Protected content can't be forwarded, only copied unchanged
+            logger.info(f"{source_channel} restricts forwarding, copying with media re-upload")
+            self.rewrite = RewritePipeline()
+        for engine in engines:
+            engine.filters = self.filters
+            engine.rewrite = self.rewrite
+            engine.restricted = self.restricted
+    
+    def apply_config(self, task):
+        """Swap in a task's edited filters and rewrite rules; used from the next batch on
+        
+        Raises TaskFatalError, leaving the old settings in place, if the
+        edited filters are invalid.
+        """
+        filters = MessageFilter.from_task(task)
+        rewrite = RewritePipeline.from_task(task)
+        if rewrite is None and self.restricted:
+            rewrite = RewritePipeline()
+        self.filters, self.rewrite = filters, rewrite
+    
+    async def load_deduplicator(self, task, dest_channel):
+        """Get the destination's dedupe stage if the task has dedupe enabled"""
+        if not (task or {}).get("dedupe", DEDUPE_ENABLED):
+            return None
+        return await ContentDeduplicator.shared(self.db, dest_channel)
+    
+    async def get_latest_message_id(self, channel):
+        """Get the ID of the newest message in channel"""
+        messages = await self.client.get_messages(channel, limit=1)
+        return messages[0].id if messages else 0
+    
+    async def iter_channel_messages(self, channel, min_id=0, max_id=0, limit=None):
+        """Lazily yield messages from channel, oldest first, between min_id and max_id
+        
+        Messages the task's filters reject are dropped here, before they
+        reach any forward request.
+        """
+        try:
+            async for message in self.client.iter_messages(channel, limit=limit, min_id=min_id, max_id=max_id, reverse=True):
+                if message and self.filters.past_end(message):
+                    break
+                if self.filters.matches(message):
+                    yield message
         except Exception as e:
             logger.error(f"Error getting messages from channel: {e}")
             raise
     
+    @staticmethod
+    def group_albums(messages):
+        """Split ordered messages into albums (shared grouped_id) and single messages"""
+        units = []
+        for message in messages:
+            if units and message.grouped_id is not None and units[-1][-1].grouped_id == message.grouped_id:
+                units[-1].append(message)
+            else:
+                units.append([message])
+        return units
+    
+    async def iter_message_batches(self, channel, min_id=0, max_id=0):
+        """Yield lists of up to batch_size messages while fetching continues
+        
+        A batch never ends in the middle of an album, so every album goes
+        out whole in a single request.
+        """
+        batch = []
+        async for message in self.iter_channel_messages(channel, min_id=min_id, max_id=max_id):
+            continues_album = bool(batch) and message.grouped_id is not None and batch[-1].grouped_id == message.grouped_id
+            if len(batch) >= self.batch_size and not continues_album:
+                yield batch
+                batch = []
+            elif len(batch) >= MAX_FORWARD_BATCH:
+                # The album would overflow the request: move it to the next batch
+                album = self.group_albums(batch)[-1]
+                if len(album) < len(batch):
+                    yield batch[:-len(album)]
+                    batch = album
+                else:
+                    yield batch
+                    batch = []
+            batch.append(message)
+        if batch:
+            yield batch
+    
     async def forward_all_messages(self, source_channel, dest_channel, task_id):
-        """Forward all existing messages from source to destination"""
+        """Forward all existing messages from source to destination
+        
+        Runs as three stages joined by bounded queues: a fetcher that
+        prefetches history batches, the forward stage in this coroutine, and
+        a checkpointer that writes progress and errors in the background.
+        """
         try:
             logger.info(f"Starting complete forward: {source_channel} -> {dest_channel}")
             
-            # Get total message count
-            messages = await self.get_channel_messages(source_channel)
-            total_messages = len(messages)
-            
-            if total_messages == 0:
-                logger.warning(f"No messages to forward from {source_channel}")
-                await self.db.update_task_progress(task_id, 0, 0, 0)
+            # Resume from the stored checkpoint
+            task = await self.db.get_task(task_id)
+            progress = (task or {}).get("progress") or {}
+            if progress.get("shards"):
+                # Started as a sharded backfill: finish the shards on this engine
+                await self.forward_all_sharded(source_channel, dest_channel, task_id, [self])
                 return
             
-            await self.db.update_task_progress(task_id, 0, total_messages, 0)
+            last_forwarded_id = progress.get("last_forwarded_message_id", 0)
+            forwarded_count = progress.get("forwarded_count", 0)
+            await self.configure(task, source_channel)
             
-            # Get last forwarded message ID to resume
-            last_forwarded_id = await self.db.get_last_forwarded_message_id(task_id)
+            # Skips what was delivered after the last checkpoint
+            message_map = await MessageMap(self.db, task_id, dest_channel).load()
+            dedupe = await self.load_deduplicator(task, dest_channel)
             
-            forwarded_count = 0
-            for i, message in enumerate(messages):
-                try:
-                    if message.id <= last_forwarded_id:
+            # Probe the total up front so progress and ETA show immediately
+            total_messages = await self.refresh_total_count(source_channel, task_id) or 0
+            
+            batches = asyncio.Queue(maxsize=PIPELINE_FETCH_AHEAD)
+            records = asyncio.Queue(maxsize=PIPELINE_RECORD_QUEUE)
+            fetch_errors = []
+            
+            fetcher = asyncio.create_task(
+                self._fetch_stage(source_channel, last_forwarded_id, batches, records, fetch_errors)
+            )
+            checkpointer = asyncio.create_task(self._checkpoint_stage(task_id, records))
+            
+            last_reported = forwarded_count
+            try:
+                while True:
+                    group = await batches.get()
+                    if group is None:
+                        break
+                    if isinstance(group, int):
+                        # Refreshed history total from the fetcher
+                        total_messages = group
                         continue
                     
-                    await self.forward_message(source_channel, dest_channel, message.id)
-                    forwarded_count += 1
+                    if not self.running.is_set() or self.stopped:
+                        # Checkpoint first so a restart resumes from this batch
+                        await records.put(("progress", (forwarded_count, total_messages, last_forwarded_id)))
+                        await self.wait_if_paused()
+                    
+                    errors = []
+                    try:
+                        forwarded_count += await self.forward_group(
+                            source_channel, dest_channel, task_id, group, errors, message_map, dedupe
+                        )
+                    except AccountFloodLimited:
+                        # Checkpoint before the failing batch so another account resumes here
+                        await records.put(("progress", (forwarded_count, total_messages, last_forwarded_id)))
+                        raise
+                    last_forwarded_id = group[-1].id
+                    
+                    if errors:
+                        await records.put(("errors", errors))
                     
                     # Update progress every PROGRESS_UPDATE_BATCH messages
-                    if forwarded_count % 100 == 0:
-                        await self.db.update_task_progress(task_id, forwarded_count, total_messages, message.id)
+                    if forwarded_count - last_reported >= PROGRESS_UPDATE_BATCH:
+                        last_reported = forwarded_count
+                        await records.put(("progress", (forwarded_count, total_messages, last_forwarded_id)))
                         logger.info(f"Progress: {forwarded_count}/{total_messages}")
-                
-                except Exception as e:
-                    await self.db.add_error_log(task_id, str(e))
-                    logger.error(f"Error forwarding message {message.id}: {e}")
-                    continue
+            finally:
+                fetcher.cancel()
+                await records.put(None)
+                await checkpointer
+                await message_map.flush()
+                if dedupe is not None:
+                    await dedupe.save(force=True)
+            
+            if fetch_errors:
+                raise fetch_errors[0]
+            
+            if forwarded_count == 0:
+                logger.warning(f"No messages to forward from {source_channel}")
             
             # Final update
-            await self.db.update_task_progress(task_id, forwarded_count, total_messages, messages[-1].id if messages else 0)
+            self.checkpointer.update_progress(task_id, forwarded_count, total_messages, last_forwarded_id)
+            await self.checkpointer.flush(task_id)
             await self.db.update_task_status(task_id, "COMPLETED")
             logger.info(f"Complete forward finished: {forwarded_count}/{total_messages} messages")
             
+        except AccountFloodLimited:
+            raise
         except Exception as e:
+            await self.checkpointer.flush(task_id)
             await self.db.add_error_log(task_id, str(e))
             await self.db.update_task_status(task_id, "ERROR")
             logger.error(f"Error in complete forward: {e}")
             raise
     
+    async def _fetch_stage(self, source_channel, min_id, batches, records, fetch_errors):
+        """Pipeline stage: prefetch history batches and refresh the total"""
+        last_count_refresh = time.monotonic()
+        try:
+            async for group in self.iter_message_batches(source_channel, min_id=min_id):
+                await batches.put(group)
+                
+                if time.monotonic() - last_count_refresh >= TOTAL_COUNT_REFRESH_INTERVAL:
+                    last_count_refresh = time.monotonic()
+                    total = await self.get_total_count(source_channel)
+                    if total is not None:
+                        await batches.put(total)
+                        await records.put(("total", total))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            fetch_errors.append(e)
+        await batches.put(None)
+    
+    async def _checkpoint_stage(self, task_id, records):
+        """Pipeline stage: write progress and error records off the forward path"""
+        while True:
+            record = await records.get()
+            if record is None:
+                break
+            kind, payload = record
+            if kind == "progress":
+                self.checkpointer.update_progress(task_id, *payload)
+            elif kind == "total":
+                await self.db.update_task_total(task_id, payload)
+            elif kind == "errors":
+                for message in payload:
+                    await self.db.add_error_log(task_id, message)
+    
+    @staticmethod
+    def split_shards(start_id, end_id, count):
+        """Split the ID range (start_id, end_id] into count contiguous shards"""
+        if end_id <= start_id or count < 1:
+            return []
+        size = -(-(end_id - start_id) // count)
+        shards = []
+        for low in range(start_id, end_id, size):
+            shards.append({
+                "min_id": low,
+                "max_id": min(low + size, end_id),
+                "last_forwarded_message_id": low,
+                "forwarded_count": 0
+            })
+        return shards
+    
+    async def forward_all_sharded(self, source_channel, dest_channel, task_id, engines, ordered=True):
+        """Backfill source in ID-range shards spread over several engines
+        
+        Unordered, each shard runs on its own engine in parallel. Ordered,
+        shards are still fetched in parallel, but a single commit stage
+        forwards them in ID order, rotating batches across the engines so
+        every account's rate budget is used.
+        """
+        try:
+            logger.info(f"Starting sharded forward: {source_channel} -> {dest_channel} ({len(engines)} accounts)")
+            
+            task = await self.db.get_task(task_id)
+            progress = (task or {}).get("progress") or {}
+            total_messages = await self.refresh_total_count(source_channel, task_id) or 0
+            
+            shards = progress.get("shards")
+            if not shards:
+                start_id = progress.get("last_forwarded_message_id", 0)
+                latest_id = await self.get_latest_message_id(source_channel)
+                shards = self.split_shards(start_id, latest_id, len(engines))
+            
+            await self.configure(task, source_channel, engines)
+            
+            state = {"forwarded": progress.get("forwarded_count", 0), "reported": progress.get("forwarded_count", 0)}
+            message_map = await MessageMap(self.db, task_id, dest_channel).load()
+            dedupe = await self.load_deduplicator(task, dest_channel)
+            
+            async def save_progress(force=False):
+                if not force and state["forwarded"] - state["reported"] < PROGRESS_UPDATE_BATCH:
+                    return
+                state["reported"] = state["forwarded"]
+                # Everything up to the first unfinished shard's checkpoint is done
+                contiguous = shards[0]["last_forwarded_message_id"] if shards else 0
+                for shard in shards:
+                    contiguous = shard["last_forwarded_message_id"]
+                    if shard["last_forwarded_message_id"] < shard["max_id"]:
+                        break
+                self.checkpointer.set(task_id, {
+                    "progress.forwarded_count": state["forwarded"],
+                    "progress.total_messages": total_messages,
+                    "progress.last_forwarded_message_id": contiguous,
+                    "progress.shards": shards
+                })
+                if force:
+                    await self.checkpointer.flush(task_id)
+            
+            async def commit(engine, shard, group):
+                if not self.running.is_set() or self.stopped:
+                    await save_progress(force=True)
+                    await self.wait_if_paused()
+                while True:
+                    if not engine.rate_limiter.is_healthy():
+                        # A flooded account's batches go out on the other accounts
+                        engine = next((other for other in engines if other.rate_limiter.is_healthy()), engine)
+                    try:
+                        forwarded = await engine.forward_group(
+                            source_channel, dest_channel, task_id, group, message_map=message_map, dedupe=dedupe
+                        )
+                        break
+                    except AccountFloodLimited as e:
+                        if not any(other.rate_limiter.is_healthy() for other in engines):
+                            # Every account is flooded: move the whole task
+                            await save_progress(force=True)
+                            raise
+                        logger.warning(f"{e}, dropping it from the shard rotation")
+                shard["last_forwarded_message_id"] = group[-1].id
+                shard["forwarded_count"] += forwarded
+                state["forwarded"] += forwarded
+                await save_progress()
+            
+            await save_progress(force=True)
+            try:
+                if ordered:
+                    await self._run_ordered_shards(source_channel, shards, engines, commit)
+                else:
+                    runs = [
+                        asyncio.create_task(self._run_shard(source_channel, shard, engines[i % len(engines)], commit))
+                        for i, shard in enumerate(shards)
+                    ]
+                    try:
+                        await asyncio.gather(*runs)
+                    finally:
+                        # Don't leave shards sending once the task fails or moves
+                        for run in runs:
+                            run.cancel()
+            finally:
+                await message_map.flush()
+                if dedupe is not None:
+                    await dedupe.save(force=True)
+            
+            await save_progress(force=True)
+            await self.db.update_task_status(task_id, "COMPLETED")
+            logger.info(f"Sharded forward finished: {state['forwarded']}/{total_messages} messages")
+        
+        except AccountFloodLimited:
+            raise
+        except Exception as e:
+            await self.checkpointer.flush(task_id)
+            await self.db.add_error_log(task_id, str(e))
+            await self.db.update_task_status(task_id, "ERROR")
+            logger.error(f"Error in sharded forward: {e}")
+            raise
+    
+    async def _run_shard(self, source_channel, shard, engine, commit):
+        """Fetch and forward one shard on one engine"""
+        async for group in engine.iter_message_batches(
+            source_channel, min_id=shard["last_forwarded_message_id"], max_id=shard["max_id"] + 1
+        ):
+            await commit(engine, shard, group)
+        shard["last_forwarded_message_id"] = shard["max_id"]
+    
+    async def _run_ordered_shards(self, source_channel, shards, engines, commit):
+        """Prefetch all shards in parallel and commit them strictly in order"""
+        queues = [asyncio.Queue(maxsize=SHARD_PREFETCH_BATCHES) for _ in shards]
+        fetch_errors = {}
+        
+        async def fetch(index, shard):
+            engine = engines[index % len(engines)]
+            try:
+                async for group in engine.iter_message_batches(
+                    source_channel, min_id=shard["last_forwarded_message_id"], max_id=shard["max_id"] + 1
+                ):
+                    await queues[index].put(group)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                fetch_errors[index] = e
+            await queues[index].put(None)
+        
+        fetchers = [asyncio.create_task(fetch(index, shard)) for index, shard in enumerate(shards)]
+        try:
+            turn = 0
+            for index, shard in enumerate(shards):
+                while True:
+                    group = await queues[index].get()
+                    if group is None:
+                        break
+                    await commit(engines[turn % len(engines)], shard, group)
+                    turn += 1
+                if index in fetch_errors:
+                    raise fetch_errors[index]
+                shard["last_forwarded_message_id"] = shard["max_id"]
+        finally:
+            for fetcher in fetchers:
+                fetcher.cancel()
+    
+    async def forward_fanout(self, source_channel, dest_channels, task_id):
+        """Read source once and forward every batch to all destinations
+        
+        A destination whose circuit opens is held rather than dropped: once
+        the reader is done it re-reads source from its own checkpoint,
+        waiting out the cooldown.
+        """
+        try:
+            logger.info(f"Starting fan-out forward: {source_channel} -> {', '.join(dest_channels)}")
+            
+            task = await self.db.get_task(task_id)
+            stored = ((task or {}).get("progress") or {}).get("destinations") or {}
+            destinations = {
+                dest: {
+                    "forwarded_count": stored.get(dest, {}).get("forwarded_count", 0),
+                    "last_forwarded_message_id": stored.get(dest, {}).get("last_forwarded_message_id", 0)
+                }
+                for dest in dest_channels
+            }
+            
+            await self.configure(task, source_channel)
+            source_total = await self.get_total_count(source_channel) or 0
+            total_messages = source_total * len(dest_channels)
+            await self.db.update_task_total(task_id, total_messages)
+            
+            async def save_progress(force=False):
+                self.checkpointer.set(task_id, {
+                    "progress.forwarded_count": sum(d["forwarded_count"] for d in destinations.values()),
+                    "progress.total_messages": total_messages,
+                    "progress.last_forwarded_message_id": min(d["last_forwarded_message_id"] for d in destinations.values()),
+                    "progress.destinations": destinations
+                })
+                if force:
+                    await self.checkpointer.flush(task_id)
+            
+            message_maps = {dest: await MessageMap(self.db, task_id, dest).load() for dest in dest_channels}
+            dedupes = {dest: await self.load_deduplicator(task, dest) for dest in dest_channels}
+            
+            # Each destination drains its own bounded queue, so a slow one only
+            # holds back the reader once it falls FANOUT_QUEUE_BATCHES behind
+            queues = {dest: asyncio.Queue(maxsize=FANOUT_QUEUE_BATCHES) for dest in dest_channels}
+            
+            flood_errors = []
+            failed_dests = set()
+            # Destinations whose circuit opened; they catch up once the reader is done
+            held_dests = set()
+            
+            async def deliver(dest):
+                state = destinations[dest]
+                last_reported = state["forwarded_count"]
+                while True:
+                    group = await queues[dest].get()
+                    if group is None:
+                        break
+                    group = [message for message in group if message.id > state["last_forwarded_message_id"]]
+                    # Keep draining after a failover or stop so the reader never blocks
+                    await self.running.wait()
+                    if not group or flood_errors or dest in failed_dests or dest in held_dests or self.stopped:
+                        continue
+                    try:
+                        state["forwarded_count"] += await self.forward_group(
+                            source_channel, dest, task_id, group, message_map=message_maps[dest], dedupe=dedupes[dest],
+                            # A paused destination would back up the shared reader
+                            wait_on_open=False
+                        )
+                    except AccountFloodLimited as e:
+                        flood_errors.append(e)
+                        continue
+                    except DestinationUnavailable as e:
+                        # Hold it rather than drop it: it resumes from its own checkpoint later
+                        held_dests.add(dest)
+                        await self.db.add_error_log(task_id, f"{dest}: {e}; retrying after the cooldown")
+                        logger.warning(f"Fan-out destination {dest} held: {e}")
+                        continue
+                    except TaskFatalError as e:
+                        # Only this destination is broken; the others carry on
+                        failed_dests.add(dest)
+                        await self.db.add_error_log(task_id, f"{dest}: {e}")
+                        logger.error(f"Fan-out destination {dest} failed: {e}")
+                        continue
+                    state["last_forwarded_message_id"] = group[-1].id
+                    
+                    if state["forwarded_count"] - last_reported >= PROGRESS_UPDATE_BATCH:
+                        last_reported = state["forwarded_count"]
+                        await save_progress()
+            
+            async def catch_up(dest):
+                """Re-read source for a held destination, waiting out its circuit"""
+                state = destinations[dest]
+                last_reported = state["forwarded_count"]
+                logger.info(f"Fan-out destination {dest} catching up from message {state['last_forwarded_message_id']}")
+                try:
+                    async for group in self.iter_message_batches(source_channel, min_id=state["last_forwarded_message_id"]):
+                        await self.wait_if_paused()
+                        state["forwarded_count"] += await self.forward_group(
+                            source_channel, dest, task_id, group, message_map=message_maps[dest], dedupe=dedupes[dest]
+                        )
+                        state["last_forwarded_message_id"] = group[-1].id
+                        
+                        if state["forwarded_count"] - last_reported >= PROGRESS_UPDATE_BATCH:
+                            last_reported = state["forwarded_count"]
+                            await save_progress()
+                except AccountFloodLimited as e:
+                    flood_errors.append(e)
+                except TaskFatalError as e:
+                    failed_dests.add(dest)
+                    await self.db.add_error_log(task_id, f"{dest}: {e}")
+                    logger.error(f"Fan-out destination {dest} failed: {e}")
+            
+            workers = [asyncio.create_task(deliver(dest)) for dest in dest_channels]
+            catch_ups = []
+            try:
+                try:
+                    min_id = min(d["last_forwarded_message_id"] for d in destinations.values())
+                    async for group in self.iter_message_batches(source_channel, min_id=min_id):
+                        if flood_errors or len(failed_dests | held_dests) == len(dest_channels):
+                            break
+                        await self.wait_if_paused()
+                        for queue in queues.values():
+                            await queue.put(group)
+                finally:
+                    for queue in queues.values():
+                        await queue.put(None)
+                    await asyncio.gather(*workers, return_exceptions=True)
+                
+                if held_dests and not flood_errors:
+                    catch_ups = [asyncio.create_task(catch_up(dest)) for dest in sorted(held_dests)]
+                    await asyncio.gather(*catch_ups)
+            finally:
+                for task in catch_ups:
+                    task.cancel()
+                await asyncio.gather(*catch_ups, return_exceptions=True)
+                if self.stopped:
+                    await save_progress(force=True)
+                for message_map in message_maps.values():
+                    await message_map.flush()
+                for dedupe in dedupes.values():
+                    if dedupe is not None:
+                        await dedupe.save(force=True)
+            
+            if flood_errors:
+                await save_progress(force=True)
+                raise flood_errors[0]
+            if len(failed_dests) == len(dest_channels):
+                raise TaskFatalError("Every destination failed")
+            
+            await save_progress(force=True)
+            if failed_dests:
+                # The others are done; report the partial failure instead of COMPLETED
+                raise TaskFatalError(f"Finished, but these destinations failed: {', '.join(sorted(failed_dests))}")
+            await self.db.update_task_status(task_id, "COMPLETED")
+            logger.info(f"Fan-out forward finished: {source_channel} -> {len(dest_channels)} destinations")
+        
+        except AccountFloodLimited:
+            raise
+        except Exception as e:
+            await self.checkpointer.flush(task_id)
+            await self.db.add_error_log(task_id, str(e))
+            await self.db.update_task_status(task_id, "ERROR")
+            logger.error(f"Error in fan-out forward: {e}")
+            raise
+    
+    async def catch_up_live(self, source_channel, dest_channel, task_id, checkpoint, high_water, forwarded_count, message_map=None, dedupe=None):
+        """Backfill messages a live task missed while it was not running"""
+        min_id = max(checkpoint, high_water - LIVE_CATCHUP_MAX_MESSAGES)
+        if min_id > checkpoint:
+            logger.warning(f"Live catch-up for {task_id} limited to IDs after {min_id} (checkpoint {checkpoint})")
+        
+        logger.info(f"Live catch-up: {source_channel} IDs {min_id + 1}-{high_water}")
+        async for group in self.iter_message_batches(source_channel, min_id=min_id, max_id=high_water + 1):
+            await self.running.wait()
+            if self.stopped:
+                break
+            forwarded_count += await self.forward_group(
+                source_channel, dest_channel, task_id, group, message_map=message_map, dedupe=dedupe
+            )
+            self.checkpointer.update_progress(task_id, forwarded_count, forwarded_count, group[-1].id)
+        
+        if not self.stopped:
+            self.checkpointer.update_progress(task_id, forwarded_count, forwarded_count, high_water)
+            await self.checkpointer.flush(task_id)
+        return forwarded_count
+    
+    async def sync_source_changes(self, source_channel, dest_channel, task_id, message_map, changes):
+        """Apply source edits and deletes to the destination in batches"""
+        failures = 0
+        while not self.stopped:
+            await asyncio.sleep(LIVE_SYNC_WINDOW)
+            await self.running.wait()
+            if self.stopped:
+                break
+            
+            edits, deletes = changes["edits"], changes["deletes"]
+            changes["edits"], changes["deletes"] = {}, set()
+            for source_id in deletes:
+                edits.pop(source_id, None)
+            try:
+                if deletes:
+                    await self.propagate_deletes(dest_channel, message_map, deletes)
+                if edits:
+                    await self.propagate_edits(source_channel, dest_channel, message_map, edits)
+            except (TaskFatalError, MessageRejected) as e:
+                await self.db.add_error_log(task_id, f"Edit/delete sync failed: {e}")
+                logger.error(f"Error syncing source changes: {e}")
+            except Exception as e:
+                failures += 1
+                if failures >= MAX_RETRIES:
+                    failures = 0
+                    await self.db.add_error_log(task_id, f"Edit/delete sync failed: {e}")
+                    logger.error(f"Error syncing source changes, giving up: {e}")
+                    continue
+                # Try again next window; edits synced before the failure match their digest by then
+                for source_id, message in edits.items():
+                    changes["edits"].setdefault(source_id, message)
+                changes["deletes"] |= deletes
+                logger.warning(f"Edit/delete sync failed, retrying next window: {e}")
+            else:
+                failures = 0
+    
+    async def propagate_deletes(self, dest_channel, message_map, source_ids):
+        """Delete the destination copies of deleted source messages"""
+        mappings = await message_map.resolve(source_ids)
+        if not mappings:
+            return
+        
+        for group in self.group_message_ids(mappings.values()):
+            await self.send_with_retry(lambda: self.client.delete_messages(dest_channel, group), dest_channel, "Delete")
+        await message_map.forget(list(mappings))
+        logger.info(f"Deleted {len(mappings)} messages from {dest_channel}")
+    
+    async def propagate_edits(self, source_channel, dest_channel, message_map, edited):
+        """Bring destination copies of edited source messages up to date
+        
+        edited maps source IDs to their latest edited message. An edit is
+        mirrored only if it advances edit_date and changes the text,
+        formatting or media, so reaction and view updates cost nothing.
+        Copies are edited in place. Forwarded messages can't be edited, so
+        the edited message is forwarded again and the old copy deleted.
+        """
+        entries = await message_map.resolve_entries(list(edited))
+        changed = {
+            source_id: entry["dest_msg_id"] for source_id, entry in entries.items()
+            if edited_at(edited[source_id]) > entry.get("edited_at", 0)
+            and content_digest(edited[source_id]) != entry.get("content")
+        }
+        if not changed:
+            return
+        
+        if self.rewrite is not None:
+            for source_id, dest_msg_id in changed.items():
+                message = edited[source_id]
+                text, entities = self.rewrite.apply(message.message, message.entities)
+                try:
+                    result = await self.send_with_retry(
+                        lambda: self.client.edit_message(dest_channel, dest_msg_id, text, formatting_entities=entities),
+                        dest_channel, "Edit"
+                    )
+                except MessageRejected as e:
+                    logger.warning(f"Skipping edit of message {source_id}: {e}")
+                    continue
+                message_map.record({source_id: result}, [message])
+            logger.info(f"Edited {len(changed)} copied messages in {dest_channel}")
+            return
+        
+        for group in self.group_message_ids(changed):
+            results = await self.forward_batch(source_channel, dest_channel, group)
+            message_map.record(results, [edited[source_id] for source_id in group])
+            replaced = [changed[source_id] for source_id, result in results.items() if result is not None]
+            if replaced:
+                await self.send_with_retry(lambda: self.client.delete_messages(dest_channel, replaced), dest_channel, "Delete")
+        logger.info(f"Re-sent {len(changed)} edited messages to {dest_channel}")
+    
     async def forward_live_messages(self, source_channel, dest_channel, task_id):
         """Forward upcoming messages from source to destination"""
+        queue = asyncio.Queue()
+        self.live_queue = queue
+        # Latest edited message per source ID, and deleted source IDs
+        changes = {"edits": {}, "deletes": set()}
+        
+        async def on_new_message(event):
+            queue.put_nowait(event.message)
+        
+        async def on_message_edited(event):
+            # Reaction and view updates of never-edited messages carry no edit_date
+            if event.message.edit_date is not None:
+                changes["edits"][event.message.id] = event.message
+        
+        async def on_message_deleted(event):
+            changes["deletes"].update(event.deleted_ids)
+        
+        new_message_event = events.NewMessage(chats=source_channel)
+        edited_event = events.MessageEdited(chats=source_channel)
+        deleted_event = events.MessageDeleted(chats=source_channel)
+        message_map = None
+        dedupe = None
+        sync_task = None
         try:
             logger.info(f"Starting live forward: {source_channel} -> {dest_channel}")
             
-            async for message in self.client.iter_messages(source_channel, min_id=0):
+            task = await self.db.get_task(task_id)
+            progress = (task or {}).get("progress") or {}
+            forwarded_count = progress.get("forwarded_count", 0)
+            checkpoint = progress.get("last_forwarded_message_id", 0)
+            await self.configure(task, source_channel)
+            message_map = await MessageMap(self.db, task_id, dest_channel).load()
+            dedupe = await self.load_deduplicator(task, dest_channel)
+            
+            # Subscribe before reading the latest ID so nothing falls in between;
+            # updates for IDs the catch-up covers are dropped below
+            self.client.add_event_handler(on_new_message, new_message_event)
+            high_water = await self.get_latest_message_id(source_channel)
+            
+            if checkpoint and high_water > checkpoint:
+                forwarded_count = await self.catch_up_live(
+                    source_channel, dest_channel, task_id, checkpoint, high_water, forwarded_count, message_map, dedupe
+                )
+            else:
+                # First start: record where live forwarding begins
+                self.checkpointer.update_progress(task_id, forwarded_count, forwarded_count, max(checkpoint, high_water))
+                await self.checkpointer.flush(task_id)
+            high_water = max(checkpoint, high_water)
+            
+            # Keep the mirror consistent with edits and deletes at the source
+            self.client.add_event_handler(on_message_edited, edited_event)
+            self.client.add_event_handler(on_message_deleted, deleted_event)
+            sync_task = asyncio.create_task(
+                self.sync_source_changes(source_channel, dest_channel, task_id, message_map, changes)
+            )
+            
+            while not self.stopped:
+                message = await queue.get()
+                if message is None:
+                    break
+                
+                if message.grouped_id is not None:
+                    # Album parts arrive as separate updates; let the rest land
+                    await asyncio.sleep(LIVE_ALBUM_WINDOW)
+                
+                # Drain whatever else already arrived into the same batch
+                batch = [message]
+                while not queue.empty() and len(batch) < self.batch_size:
+                    message = queue.get_nowait()
+                    if message is None:
+                        break
+                    batch.append(message)
+                
+                # Messages keep queueing while paused and go out on resume
+                await self.running.wait()
+                if self.stopped:
+                    break
+                
                 try:
-                    # Check task status
-                    task = await self.db.get_task(task_id)
-                    if task["status"] == "PAUSED":
-                        await asyncio.sleep(5)
+                    group = sorted(
+                        (message for message in batch if message and message.id > high_water and self.filters.matches(message)),
+                        key=lambda message: message.id
+                    )
+                    if not group:
                         continue
-                    if task["status"] not in ["RUNNING", "PAUSED"]:
-                        break
                     
-                    if message and message.text:
-                        await self.forward_message(source_channel, dest_channel, message.id)
-                        await self.db.update_task_progress(task_id, 1, 1, message.id)
+                    forwarded = await self.forward_group(
+                        source_channel, dest_channel, task_id, group, message_map=message_map, dedupe=dedupe
+                    )
+                    forwarded_count += forwarded
+                    high_water = group[-1].id
+                    self.checkpointer.increment(task_id, {
+                        "progress.forwarded_count": forwarded,
+                        "progress.total_messages": forwarded
+                    })
+                    self.checkpointer.set(task_id, {"progress.last_forwarded_message_id": high_water})
                 
+                except (AccountFloodLimited, TaskFatalError):
+                    raise
                 except Exception as e:
                     await self.db.add_error_log(task_id, str(e))
                     logger.error(f"Error in live forward: {e}")
                     continue
+            
+            logger.info(f"Live forward stopped: {source_channel} -> {dest_channel}")
         
+        except AccountFloodLimited:
+            raise
         except Exception as e:
+            await self.checkpointer.flush(task_id)
             await self.db.add_error_log(task_id, str(e))
             await self.db.update_task_status(task_id, "ERROR")
             logger.error(f"Live forward error: {e}")
+        
+        finally:
+            self.client.remove_event_handler(on_new_message, new_message_event)
+            self.client.remove_event_handler(on_message_edited, edited_event)
+            self.client.remove_event_handler(on_message_deleted, deleted_event)
+            if sync_task is not None:
+                sync_task.cancel()
+            self.live_queue = None
+            if message_map is not None:
+                await message_map.flush()
+            if dedupe is not None:
+                await dedupe.save(force=True)
+            await self.checkpointer.flush(task_id)
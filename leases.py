@@ -0,0 +1,97 @@
+import asyncio
+import math
+from datetime import datetime
+import logging
+from config import TASK_LEASE_SECONDS, TASK_LEASE_HEARTBEAT, TASK_REBALANCE_MARGIN
+
+logger = logging.getLogger(__name__)
+
+class TaskLeaseKeeper:
+    """Shares tasks between bot replicas without running any task twice
+    
+    A replica only runs tasks whose lease it holds. Leases are claimed
+    atomically, renewed every TASK_LEASE_HEARTBEAT and taken over by another
+    replica once TASK_LEASE_SECONDS pass without a renewal. Each replica
+    claims orphaned tasks up to its fair share of the running tasks, and
+    hands one back per heartbeat while it holds more than that.
+    """
+    
+    def __init__(self, db, task_manager, instance_id):
+        self.db = db
+        self.task_manager = task_manager
+        self.instance_id = instance_id
+        self._loop = None
+    
+    def start(self):
+        if self._loop is None or self._loop.done():
+            self._loop = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._loop is not None:
+            self._loop.cancel()
+            self._loop = None
+        await self.db.remove_instance(self.instance_id)
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(TASK_LEASE_HEARTBEAT)
+            try:
+                await self.heartbeat()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error renewing task leases: {e}")
+    
+    async def claim(self, task_id, statuses=("RUNNING", "PAUSED")):
+        """Take a task's lease; returns the task, or None if another replica holds it"""
+        return await self.db.claim_task(task_id, self.instance_id, TASK_LEASE_SECONDS, statuses)
+    
+    async def release(self, task_id):
+        await self.db.release_task_lease(task_id, self.instance_id)
+    
+    async def heartbeat(self):
+        """Renew our leases, stop tasks whose lease was lost, then balance load"""
+        active_tasks = self.task_manager.active_tasks
+        await self.db.heartbeat_instance(self.instance_id, self.running_load(), TASK_LEASE_SECONDS)
+        
+        task_ids = list(active_tasks)
+        if task_ids:
+            owned = await self.db.renew_task_leases(task_ids, self.instance_id, TASK_LEASE_SECONDS)
+            # None means Mongo didn't answer: keep running rather than guess
+            lost = [task_id for task_id in task_ids if task_id not in owned] if owned is not None else []
+            for task_id in lost:
+                logger.warning(f"Lease on task {task_id} was taken over, stopping it here")
+                self.task_manager.detach_task(task_id, release=False)
+        
+        fair_share = await self.fair_share()
+        load = self.running_load()
+        if load < fair_share:
+            await self.claim_orphans(fair_share - load)
+        elif load > fair_share + TASK_REBALANCE_MARGIN:
+            self.hand_off_one()
+    
+    def running_load(self):
+        """RUNNING tasks held here; paused ones don't count, as in fair_share()"""
+        return sum(1 for runtime in self.task_manager.active_tasks.values() if runtime.status == "RUNNING")
+    
+    async def fair_share(self):
+        """Running tasks per live replica, rounded up"""
+        replicas = await self.db.count_live_instances()
+        running = await self.db.count_running_tasks()
+        return math.ceil(running / max(replicas, 1))
+    
+    async def claim_orphans(self, limit):
+        """Start RUNNING tasks that no live replica holds"""
+        for task in await self.db.get_orphaned_tasks(datetime.utcnow(), limit):
+            if task["_id"] in self.task_manager.active_tasks:
+                continue
+            logger.info(f"Taking over task {task['_id']}")
+            await self.task_manager.start_task_directly(task)
+    
+    def hand_off_one(self):
+        """Give the newest running task back so a less loaded replica picks it up"""
+        for task_id, runtime in reversed(list(self.task_manager.active_tasks.items())):
+            if runtime.status == "RUNNING":
+                logger.info(f"Handing off task {task_id} to rebalance replicas")
+                self.task_manager.detach_task(task_id)
+                return
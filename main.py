@@ -110,6 +110,9 @@ class ForwarderBot:
             else:
                 logger.info("User session not found - login required")
             
+            # Connect extra user accounts used to spread tasks
+            await self.clients.load_account_pool(self.db)
+            
             # Bot is initialized from token (no session needed)
             logger.info("Bot account ready (using token)")
             
@@ -149,7 +152,8 @@ class ForwarderBot:
         try:
             logger.info("Stopping Forwarder Bot...")
             self.is_healthy = False
-            await self.task_manager.pause_all_tasks()
+            # Tasks stay RUNNING so another replica, or this one after a restart, picks them up
+            await self.task_manager.shutdown()
             await self.clients.stop_all_clients()
             await self.db.close()
             logger.info("Bot stopped successfully")
@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+import random
+from telethon.tl.functions.upload import SaveFilePartRequest, SaveBigFilePartRequest
+from telethon.tl.types import InputFile, InputFileBig, InputMediaUploadedPhoto, InputMediaUploadedDocument
+import logging
+from config import MEDIA_PART_SIZE, MEDIA_BYTES_IN_FLIGHT, MEDIA_PARALLEL_FILES, MEDIA_BIG_FILE_SIZE, MEDIA_PIPE_CHUNKS
+
+logger = logging.getLogger(__name__)
+
+class ByteSemaphore:
+    """Limits the bytes held in memory by all media transfers together"""
+    
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+    
+    async def acquire(self, size):
+        async with self.condition:
+            # A chunk larger than the limit still goes through on its own
+            await self.condition.wait_for(lambda: self.in_flight == 0 or self.in_flight + size <= self.limit)
+            self.in_flight += size
+    
+    async def release(self, size):
+        async with self.condition:
+            self.in_flight -= size
+            self.condition.notify_all()
+
+# Shared by every task, so media can't crowd out memory or connections
+buffer_budget = ByteSemaphore(MEDIA_BYTES_IN_FLIGHT)
+file_slots = asyncio.Semaphore(MEDIA_PARALLEL_FILES)
+
+def has_uploadable_media(message):
+    """True for photos and documents, the media that can be re-uploaded"""
+    return bool(message.photo or message.document)
+
+class MediaReuploader:
+    """Re-uploads media from sources that restrict forwarding
+    
+    Each file is piped from iter_download straight into upload parts
+    through a small in-memory queue, so no temp files are written and
+    memory stays within buffer_budget whatever the file size.
+    """
+    
+    def __init__(self, client):
+        self.client = client
+    
+    async def reupload(self, message):
+        """Stream the message's photo or document and return uploaded InputMedia"""
+        async with file_slots:
+            input_file = await self.stream(message)
+        
+        if message.photo:
+            return InputMediaUploadedPhoto(file=input_file)
+        document = message.document
+        return InputMediaUploadedDocument(
+            file=input_file,
+            mime_type=document.mime_type,
+            attributes=document.attributes,
+            force_file=False
+        )
+    
+    async def stream(self, message):
+        """Pipe download chunks into SaveFilePart requests"""
+        size = message.file.size or 0
+        is_big = size > MEDIA_BIG_FILE_SIZE
+        part_count = -(-size // MEDIA_PART_SIZE)
+        file_id = random.randrange(-2 ** 63, 2 ** 63)
+        md5 = hashlib.md5()
+        queue = asyncio.Queue(maxsize=MEDIA_PIPE_CHUNKS)
+        download_errors = []
+        
+        async def download():
+            try:
+                async for chunk in self.client.iter_download(
+                    message.media, chunk_size=MEDIA_PART_SIZE, request_size=MEDIA_PART_SIZE, file_size=size or None
+                ):
+                    await buffer_budget.acquire(len(chunk))
+                    try:
+                        await queue.put(chunk)
+                    except asyncio.CancelledError:
+                        await buffer_budget.release(len(chunk))
+                        raise
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                download_errors.append(e)
+            await queue.put(None)
+        
+        downloader = asyncio.create_task(download())
+        part = 0
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    break
+                try:
+                    if is_big:
+                        request = SaveBigFilePartRequest(file_id, part, part_count, chunk)
+                    else:
+                        md5.update(chunk)
+                        request = SaveFilePartRequest(file_id, part, chunk)
+                    if not await self.client(request):
+                        raise RuntimeError(f"Upload part {part} of message {message.id} was rejected")
+                finally:
+                    await buffer_budget.release(len(chunk))
+                part += 1
+        finally:
+            downloader.cancel()
+            # Give back the budget of chunks that were never uploaded
+            while not queue.empty():
+                chunk = queue.get_nowait()
+                if chunk is not None:
+                    await buffer_budget.release(len(chunk))
+        
+        if download_errors:
+            raise download_errors[0]
+        
+        name = message.file.name or f"media{message.file.ext or ''}"
+        logger.debug(f"Re-uploaded message {message.id} ({size} bytes, {part} parts)")
+        if is_big:
+            return InputFileBig(file_id, part, name)
+        return InputFile(file_id, part, name, md5.hexdigest())
@@ -47,12 +47,13 @@ class MessageFormatter:
         """Format task status for display"""
         try:
             source = task.get("source_channel", "Unknown")
-            dest = task.get("dest_channel", "Unknown")
+            dest = ", ".join(task.get("dest_channels") or []) or task.get("dest_channel") or "Unknown"
             status = task.get("status", "UNKNOWN")
             task_type = task.get("type", "unknown")
             
             progress = task.get("progress", {})
-            forwarded = progress.get("forwarded_count", 0)
+            # Dead-letter retries are counted apart from the engine's own count
+            forwarded = progress.get("forwarded_count", 0) + progress.get("retried_count", 0)
             total = progress.get("total_messages", 0)
             start_time = task.get("created_at")
             
@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+def content_digest(message):
+    """Hash what a mirror shows of a message: its text, formatting and media"""
+    media = message.photo or message.document
+    parts = [
+        message.message or "",
+        repr([entity.to_dict() for entity in message.entities or []]),
+        str(media.id) if media is not None else ""
+    ]
+    return hashlib.blake2b("\0".join(parts).encode(), digest_size=16).digest()
+
+def edited_at(message):
+    """A message's edit_date as a UTC timestamp, 0 if it was never edited"""
+    return int(message.edit_date.timestamp()) if message.edit_date else 0
+
+class MessageIdBitmap:
+    """Set of message IDs stored as one bit per ID"""
+    
+    def __init__(self):
+        self.bits = bytearray()
+    
+    def add(self, message_id):
+        index = message_id >> 3
+        if index >= len(self.bits):
+            # Grow geometrically so backfills don't resize on every batch
+            self.bits.extend(bytes(max(index + 1 - len(self.bits), len(self.bits))))
+        self.bits[index] |= 1 << (message_id & 7)
+    
+    def __contains__(self, message_id):
+        index = message_id >> 3
+        return index < len(self.bits) and bool(self.bits[index] & (1 << (message_id & 7)))
+
+class MessageMap:
+    """Source to destination message IDs for one task and destination
+    
+    Delivered source IDs are preloaded into a bitmap so resumed tasks skip
+    them without API calls; new mappings are upserted in bulk behind the
+    forward loop.
+    """
+    
+    def __init__(self, db, task_id, dest_channel):
+        self.db = db
+        self.task_id = task_id
+        self.dest_channel = dest_channel
+        self.delivered = MessageIdBitmap()
+        self.pending = []
+        self._flush_task = None
+    
+    async def load(self):
+        """Preload every source ID already delivered for this task"""
+        count = 0
+        async for source_msg_id in self.db.iter_delivered_message_ids(self.task_id, self.dest_channel):
+            self.delivered.add(source_msg_id)
+            count += 1
+        if count:
+            logger.info(f"Task {self.task_id}: {count} messages already delivered to {self.dest_channel}")
+        return self
+    
+    def filter_new(self, messages):
+        """Drop messages that were already delivered"""
+        return [message for message in messages if message.id not in self.delivered]
+    
+    def record(self, results, messages=()):
+        """Remember forwarded messages from a {source_id: forwarded_message} batch
+        
+        For source messages given in messages, the content digest and edit
+        time are kept too, so later edit events can tell real edits apart.
+        """
+        sources = {message.id: message for message in messages}
+        for source_msg_id, forwarded in results.items():
+            if forwarded is None:
+                continue
+            self.delivered.add(source_msg_id)
+            fields = {}
+            message = sources.get(source_msg_id)
+            if message is not None:
+                fields = {"content": content_digest(message), "edited_at": edited_at(message)}
+            self.pending.append((source_msg_id, forwarded.id, fields))
+        
+        if self.pending and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self._flush_pending())
+    
+    async def resolve(self, source_msg_ids):
+        """Get {source_id: dest_id} for source IDs that were delivered"""
+        await self.flush()
+        return await self.db.get_message_mappings(self.task_id, self.dest_channel, source_msg_ids)
+    
+    async def resolve_entries(self, source_msg_ids):
+        """Get {source_id: {dest_msg_id, content, edited_at}} for delivered source IDs"""
+        await self.flush()
+        return await self.db.get_message_map_entries(self.task_id, self.dest_channel, source_msg_ids)
+    
+    async def forget(self, source_msg_ids):
+        """Drop mappings whose destination messages were deleted"""
+        await self.flush()
+        await self.db.delete_message_mappings(self.task_id, self.dest_channel, source_msg_ids)
+    
+    async def _flush_pending(self):
+        while self.pending:
+            entries, self.pending = self.pending, []
+            await self.db.bulk_upsert_message_map(self.task_id, self.dest_channel, entries)
+    
+    async def flush(self):
+        """Wait until every recorded mapping is written"""
+        if self._flush_task is not None:
+            await self._flush_task
+        await self._flush_pending()
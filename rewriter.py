@@ -0,0 +1,130 @@
+import copy
+import re
+from bisect import bisect_right
+from telethon.helpers import add_surrogate, del_surrogate
+from telethon.tl.types import MessageEntityTextUrl
+import logging
+
+logger = logging.getLogger(__name__)
+
+LINK_PATTERN = r"(?:https?://|www\.|t\.me/)\S+"
+
+class RewritePipeline:
+    """A copy-mode task's text rewrites, compiled once
+    
+    Rules come from the task's "rewrite" field:
+    replacements (list of {"pattern", "replace", "regex"}), strip_links and
+    template (with "{text}" where the original text goes). Each rule is
+    compiled and validated on its own, so backreferences and named groups
+    work and one bad rule is skipped without disabling the rest. Text is
+    rewritten in one left-to-right pass: at each point the earliest match
+    wins, ties going to the earlier rule, and entity offsets are remapped
+    as it goes.
+    """
+    
+    def __init__(self, rules=None):
+        rules = rules or {}
+        self.rules = rules
+        # (compiled, replacement, is_regex) in rule order
+        self.compiled = []
+        for index, rule in enumerate(rules.get("replacements", [])):
+            try:
+                is_regex = bool(rule.get("regex"))
+                compiled = re.compile(rule["pattern"] if is_regex else re.escape(rule["pattern"]))
+                replace = rule.get("replace", "")
+                if is_regex:
+                    # Fails here on references to groups the pattern lacks
+                    compiled.sub(replace, "")
+            except (re.error, KeyError, TypeError) as e:
+                logger.error(f"Skipping invalid rewrite rule {index}: {e}")
+                continue
+            self.compiled.append((compiled, replace, is_regex))
+        self.strip_links = bool(rules.get("strip_links"))
+        if self.strip_links:
+            self.compiled.append((re.compile(LINK_PATTERN), "", False))
+        
+        self.prefix, self.suffix = "", ""
+        template = rules.get("template")
+        if template:
+            prefix, marker, suffix = template.partition("{text}")
+            # A template without {text} is appended as a footer
+            self.prefix, self.suffix = (prefix, suffix) if marker else ("", "\n\n" + template)
+    
+    @classmethod
+    def from_task(cls, task):
+        """Compile the task's rewrite rules, or None unless the task is in copy mode"""
+        if (task or {}).get("mode") != "copy":
+            return None
+        try:
+            return cls(task.get("rewrite"))
+        except (re.error, KeyError, TypeError, AttributeError) as e:
+            logger.error(f"Invalid rewrite rules, copying text unchanged: {e}")
+            return cls()
+    
+    def _matches(self, text):
+        """Yield (match, replacement) left to right without overlaps"""
+        upcoming = [None] * len(self.compiled)
+        position = 0
+        while True:
+            best = None
+            for index, (compiled, _, _) in enumerate(self.compiled):
+                match = upcoming[index]
+                if match is not False and (match is None or match.start() < position):
+                    match = compiled.search(text, position)
+                    # Empty matches replace nothing; look past them
+                    while match is not None and match.end() == match.start():
+                        match = compiled.search(text, match.start() + 1) if match.start() < len(text) else None
+                    upcoming[index] = match if match is not None else False
+                if match and (best is None or match.start() < best[0].start()):
+                    best = (match, index)
+            if best is None:
+                return
+            match, index = best
+            _, replace, is_regex = self.compiled[index]
+            yield match, match.expand(replace) if is_regex else replace
+            position = match.end()
+    
+    def apply(self, text, entities=None):
+        """Return the rewritten (text, entities) of a message"""
+        text = add_surrogate(text or "")
+        entities = [entity for entity in entities or [] if not (self.strip_links and isinstance(entity, MessageEntityTextUrl))]
+        
+        # Segments of (source start, source end, output start, output end, replaced)
+        pieces = [add_surrogate(self.prefix)]
+        segments = []
+        output = len(pieces[0])
+        source_position = 0
+        for match, replacement in self._matches(text):
+            if match.start() > source_position:
+                length = match.start() - source_position
+                segments.append((source_position, match.start(), output, output + length, False))
+                pieces.append(text[source_position:match.start()])
+                output += length
+            replacement = add_surrogate(replacement)
+            segments.append((match.start(), match.end(), output, output + len(replacement), True))
+            pieces.append(replacement)
+            output += len(replacement)
+            source_position = match.end()
+        if source_position < len(text) or not segments:
+            segments.append((source_position, len(text), output, output + len(text) - source_position, False))
+            pieces.append(text[source_position:])
+        pieces.append(add_surrogate(self.suffix))
+        starts = [segment[0] for segment in segments]
+        
+        def remap(offset, is_end):
+            index = bisect_right(starts, offset - 1 if is_end and offset else offset) - 1
+            source_start, source_end, output_start, output_end, replaced = segments[max(index, 0)]
+            if replaced:
+                return output_end if is_end else output_start
+            return output_start + min(offset, source_end) - source_start
+        
+        remapped = []
+        for entity in entities:
+            start = remap(entity.offset, False)
+            end = remap(entity.offset + entity.length, True)
+            if end > start:
+                entity = copy.copy(entity)
+                entity.offset, entity.length = start, end - start
+                remapped.append(entity)
+        
+        return del_surrogate("".join(pieces)), remapped
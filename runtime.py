@@ -0,0 +1,85 @@
+import asyncio
+import logging
+from config import TASK_STOP_GRACE
+
+logger = logging.getLogger(__name__)
+
+class TaskCancelled(asyncio.CancelledError):
+    """Raised between batches once a task's cancel token is set"""
+
+class CancelToken:
+    """One-way stop flag that can also be awaited"""
+    
+    def __init__(self):
+        self._event = asyncio.Event()
+    
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+    
+    def cancel(self):
+        self._event.set()
+    
+    async def wait(self):
+        await self._event.wait()
+
+class TaskRuntime:
+    """In-memory control of one task running in this process
+    
+    Keeps the asyncio.Task running the task, a pause Event and a cancel
+    token. Every engine of the task shares the Event and token, so pause,
+    resume and stop reach all of them at the next batch boundary without
+    any reads from Mongo. The runtime outlives account migrations: a moved
+    task gets new engines and a new handle but keeps its pause state.
+    """
+    
+    def __init__(self, task_id, source, dest, task_type, auth_method):
+        self.task_id = task_id
+        self.source = source
+        self.dest = dest
+        self.type = task_type
+        self.auth_method = auth_method
+        self.account_id = None
+        self.engines = []
+        self.handle = None
+        self.running = asyncio.Event()
+        self.running.set()
+        self.token = CancelToken()
+    
+    @property
+    def engine(self):
+        """The engine that owns the task's progress"""
+        return self.engines[0] if self.engines else None
+    
+    @property
+    def status(self):
+        if self.token.cancelled:
+            return "STOPPED"
+        return "RUNNING" if self.running.is_set() else "PAUSED"
+    
+    @property
+    def done(self):
+        return self.handle is not None and self.handle.done()
+    
+    def pause(self):
+        """Hold every engine at its next batch"""
+        self.running.clear()
+    
+    def resume(self):
+        self.running.set()
+    
+    def stop(self):
+        """Cancel the token and wake anything waiting on the task"""
+        self.token.cancel()
+        self.running.set()
+        for engine in self.engines:
+            engine.stop()
+    
+    async def join(self, timeout=TASK_STOP_GRACE):
+        """Wait for a stopped task to finish its batch, cancelling it after timeout"""
+        if self.handle is None or self.handle.done():
+            return
+        done, _ = await asyncio.wait({self.handle}, timeout=timeout)
+        if not done:
+            logger.warning(f"Task {self.task_id} did not stop within {timeout}s, cancelling it")
+            self.handle.cancel()
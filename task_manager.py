@@ -1,7 +1,15 @@
 import asyncio
+from collections import Counter
 from datetime import datetime
 from bson import ObjectId
 import logging
+from checkpointer import ProgressCheckpointer
+from deadletter import DeadLetterScheduler
+from runtime import TaskRuntime
+from leases import TaskLeaseKeeper
+from control_plane import TaskControlPlane
+from utils import TaskFatalError
+from config import INSTANCE_ID
 
 logger = logging.getLogger(__name__)
 
@@ -9,56 +17,203 @@ class TaskManager:
     def __init__(self, clients, db):
         self.clients = clients
         self.db = db
+        # task_id -> TaskRuntime of every task running in this process
         self.active_tasks = {}
+        # Shared by every engine so progress writes coalesce across tasks
+        self.checkpointer = ProgressCheckpointer(db)
+        self.dead_letters = DeadLetterScheduler(db, self)
+        self.retry_engines = {}
+        # Replicas only run tasks whose lease they hold
+        self.instance_id = INSTANCE_ID
+        self.leases = TaskLeaseKeeper(db, self, INSTANCE_ID)
+        # Applies commands issued on any replica to the tasks running here
+        self.control_plane = TaskControlPlane(db, self)
     
     async def initialize(self):
         """Initialize task manager"""
+        self.dead_letters.start()
+        self.control_plane.start()
         logger.info("Task manager initialized")
     
     async def resume_tasks(self):
-        """Resume interrupted tasks"""
+        """Resume interrupted tasks, up to this replica's fair share"""
         try:
-            active_tasks = await self.db.get_active_tasks()
-            
-            for task in active_tasks:
-                if task["status"] == "RUNNING":
-                    logger.info(f"Resuming task: {task['_id']}")
-                    await self.start_task_directly(task)
+            await self.leases.heartbeat()
+            self.leases.start()
         
         except Exception as e:
             logger.error(f"Error resuming tasks: {e}")
     
-    async def start_forward_task_direct(self, source_channel, dest_channel, auth_method, task_type, user_id):
-        """Start forwarding task directly from source and destination"""
+    def _pick_account(self, auth_method, exclude=None):
+        """Pick the least-loaded healthy account as (account_id, client)"""
+        if auth_method != "user_account":
+            return auth_method, self.clients.telegram_bot
+        
+        load = Counter(runtime.account_id for runtime in self.active_tasks.values())
+        candidates = self._healthy_accounts(auth_method, exclude)
+        if not candidates:
+            return None, None
+        return min(candidates, key=lambda candidate: load[candidate[0]])
+    
+    def _healthy_accounts(self, auth_method, exclude=None):
+        """List (account_id, client) pairs with no pending flood wait"""
+        from forwarder import RateLimiter
+        return [
+            (account_id, client)
+            for account_id, client in self.clients.get_user_accounts().items()
+            if account_id != exclude and RateLimiter.shared(auth_method, account_id).is_healthy()
+        ]
+    
+    async def _launch_engine(self, task_id, source, dest, auth_method, task_type, exclude_account=None, runtime=None):
+        """Start a task on the best account and keep its runtime for control
+        
+        A migrating task passes its existing runtime, so its pause state and
+        cancel token carry over to the new engines.
+        """
+        from forwarder import ForwardingEngine
+        account_id, client = self._pick_account(auth_method, exclude=exclude_account)
+        if not client:
+            return None
+        
+        if runtime is None:
+            runtime = TaskRuntime(task_id, source, dest, task_type, auth_method)
+        
+        # Failover only helps when there is another account to move to; sharded
+        # backfills move a flooded account's batches to the other shards' accounts
+        failover = auth_method == "user_account" and len(self.clients.get_user_accounts()) > 1
+        
+        # Complete backfills are sharded across every healthy account
+        helpers = []
+        if task_type == "complete" and auth_method == "user_account":
+            helpers = [
+                ForwardingEngine(
+                    other_client, auth_method, self.db,
+                    account_key=other_id, failover=failover, checkpointer=self.checkpointer, runtime=runtime
+                )
+                for other_id, other_client in self._healthy_accounts(auth_method, exclude=exclude_account)
+                if other_id != account_id
+            ]
+        
+        engine = ForwardingEngine(
+            client, auth_method, self.db,
+            account_key=account_id, failover=failover, checkpointer=self.checkpointer, runtime=runtime
+        )
+        runtime.engines = [engine] + helpers
+        runtime.account_id = account_id
+        self.active_tasks[task_id] = runtime
+        await self.db.update_task_account(task_id, account_id)
+        runtime.handle = asyncio.create_task(self._run_engine(runtime))
+        return engine
+    
+    async def _run_engine(self, runtime):
+        """Run a task's engines to completion, moving the task if its account floods"""
+        from forwarder import AccountFloodLimited
+        from config import BACKFILL_PRESERVE_ORDER
+        task_id, source, dest = runtime.task_id, runtime.source, runtime.dest
+        engines = runtime.engines
+        engine = engines[0]
         try:
-            # Create task in DB
-            task_id = await self.db.create_task(source_channel, dest_channel, auth_method, task_type, user_id)
-            
-            self.active_tasks[task_id] = {
-                "source": source_channel,
-                "dest": dest_channel,
-                "type": task_type,
-                "status": "RUNNING"
-            }
-            
-            # Get appropriate client
-            if auth_method == "user_account":
-                client = self.clients.user_client
+            if runtime.type == "complete" and len(engines) > 1:
+                await engine.forward_all_sharded(source, dest, task_id, engines, ordered=BACKFILL_PRESERVE_ORDER)
+            elif runtime.type == "complete":
+                await engine.forward_all_messages(source, dest, task_id)
+            elif runtime.type == "fanout":
+                await engine.forward_fanout(source, dest, task_id)
             else:
-                client = self.clients.telegram_bot
-            
+                await engine.forward_live_messages(source, dest, task_id)
+        except AccountFloodLimited as e:
+            logger.warning(f"Task {task_id}: {e}")
+            await self.checkpointer.flush(task_id)
+            await self._migrate_task(runtime, engine, e)
+        except asyncio.CancelledError:
+            logger.info(f"Task {task_id} cancelled")
+        except Exception as e:
+            logger.error(f"Task {task_id} ended with error: {e}")
+        finally:
+            # A migration has already handed the runtime a new handle
+            if runtime.handle is asyncio.current_task() and self.active_tasks.get(task_id) is runtime:
+                del self.active_tasks[task_id]
+                await self.leases.release(task_id)
+    
+    async def _migrate_task(self, runtime, engine, error):
+        """Move a task off a flood-limited account, resuming from its checkpoint"""
+        task_id = runtime.task_id
+        if self.active_tasks.get(task_id) is not runtime or runtime.engine is not engine or runtime.token.cancelled:
+            return
+        
+        account_id, client = self._pick_account(runtime.auth_method, exclude=error.account_key)
+        if not client:
+            logger.warning(f"No healthy account for task {task_id}, waiting {error.seconds}s")
+            await asyncio.sleep(error.seconds)
+            if self.active_tasks.get(task_id) is not runtime or runtime.token.cancelled:
+                return
+        
+        new_engine = await self._launch_engine(
+            task_id, runtime.source, runtime.dest, runtime.auth_method, runtime.type,
+            exclude_account=error.account_key if client else None, runtime=runtime
+        )
+        if new_engine is None:
+            logger.error(f"Could not move task {task_id}: no account available")
+            return
+        logger.info(f"Task {task_id} moved from {error.account_key} to {runtime.account_id}")
+    
+    async def get_retry_engine(self, task):
+        """Engine for dead-letter retries: the task's own if it runs here"""
+        from forwarder import ForwardingEngine
+        task_id = task["_id"]
+        runtime = self.active_tasks.get(task_id)
+        if runtime:
+            return runtime.engine
+        # Running elsewhere: its owner retries; otherwise the lease picks one replica
+        if task.get("status") == "RUNNING" or not await self.leases.claim(task_id, statuses=("COMPLETED", "ERROR")):
+            return None
+        
+        engine = self.retry_engines.get(task_id)
+        if engine is None or not engine.rate_limiter.is_healthy():
+            account_id, client = self._pick_account(task["auth_method"])
+            if not client:
+                return None
+            engine = ForwardingEngine(client, task["auth_method"], self.db, account_key=account_id, checkpointer=self.checkpointer)
+            try:
+                await engine.configure(task, task["source_channel"])
+            except TaskFatalError as e:
+                logger.error(f"Not retrying dead letters of task {task_id}: {e}")
+                return None
+            self.retry_engines[task_id] = engine
+        return engine
+    
+    def prune_retry_engines(self, task_ids):
+        """Forget retry engines of tasks with no due dead letters or now running here"""
+        for task_id in list(self.retry_engines):
+            if task_id not in task_ids or task_id in self.active_tasks:
+                del self.retry_engines[task_id]
+    
+    async def start_forward_task_direct(self, source_channel, dest_channel, auth_method, task_type, user_id, options=None):
+        """Start forwarding task directly from source and destination
+        
+        For task_type "fanout", dest_channel is a list of destinations.
+        options holds per-task settings, e.g. {"mode": "copy", "rewrite": {...}}.
+        """
+        try:
+            # Make sure some account can run the task
+            account_id, client = self._pick_account(auth_method)
             if not client:
                 raise Exception(f"Client not available for {auth_method}")
             
+            # Create task in DB
+            task_id = await self.db.create_task(source_channel, dest_channel, auth_method, task_type, user_id, options)
+            if not await self.leases.claim(task_id):
+                # The new task is RUNNING without a lease, so another replica may have adopted it
+                task = await self.db.get_task(task_id)
+                owner = ((task or {}).get("lease") or {}).get("owner")
+                if owner and owner != self.leases.instance_id:
+                    logger.info(f"Task {task_id} was picked up by replica {owner}")
+                    return task_id
+                await self.db.update_task_status(task_id, "ERROR")
+                raise Exception(f"Could not claim task {task_id}")
+            
             # Start forwarding in background
-            if task_type == "complete":
-                from forwarder import ForwardingEngine
-                engine = ForwardingEngine(client, auth_method, self.db)
-                asyncio.create_task(engine.forward_all_messages(source_channel, dest_channel, task_id))
-            else:
-                from forwarder import ForwardingEngine
-                engine = ForwardingEngine(client, auth_method, self.db)
-                asyncio.create_task(engine.forward_live_messages(source_channel, dest_channel, task_id))
+            await self._launch_engine(task_id, source_channel, dest_channel, auth_method, task_type)
             
             logger.info(f"Task started: {task_id} ({task_type})")
             return task_id
@@ -71,37 +226,31 @@ class TaskManager:
         """Resume a task from DB"""
         try:
             task_id = task.get("_id")
-            source = task.get("source_channel")
-            dest = task.get("dest_channel")
             auth_method = task.get("auth_method")
-            task_type = task.get("type")
-            
-            if auth_method == "user_account":
-                client = self.clients.user_client
-            else:
-                client = self.clients.telegram_bot
+            if task_id in self.active_tasks:
+                return
+            if not await self.leases.claim(task_id):
+                logger.info(f"Task {task_id} is owned by another replica")
+                return
             
-            if not client:
+            dest = task.get("dest_channels") or task.get("dest_channel")
+            engine = await self._launch_engine(task_id, task.get("source_channel"), dest, auth_method, task.get("type"))
+            if not engine:
                 logger.warning(f"Client not available for {auth_method}")
                 return
             
-            if task_type == "complete":
-                from forwarder import ForwardingEngine
-                engine = ForwardingEngine(client, auth_method, self.db)
-                asyncio.create_task(engine.forward_all_messages(source, dest, task_id))
-            else:
-                from forwarder import ForwardingEngine
-                engine = ForwardingEngine(client, auth_method, self.db)
-                asyncio.create_task(engine.forward_live_messages(source, dest, task_id))
-            
             logger.info(f"Task resumed: {task_id}")
         
         except Exception as e:
             logger.error(f"Error resuming task: {e}")
     
     async def pause_task(self, task_id):
-        """Pause a running task"""
+        """Pause a running task; its engines hold at the next batch"""
         try:
+            runtime = self.active_tasks.get(task_id)
+            if runtime:
+                runtime.pause()
+            await self.checkpointer.flush(task_id)
             await self.db.update_task_status(task_id, "PAUSED")
             logger.info(f"Task paused: {task_id}")
         except Exception as e:
@@ -110,17 +259,42 @@ class TaskManager:
     async def resume_task(self, task_id):
         """Resume a paused task"""
         try:
+            runtime = self.active_tasks.get(task_id)
+            if runtime:
+                runtime.resume()
+            else:
+                # Paused before a restart: nothing runs here yet
+                task = await self.db.get_task(task_id)
+                if task and task.get("status") == "PAUSED":
+                    await self.start_task_directly(task)
             await self.db.update_task_status(task_id, "RUNNING")
             logger.info(f"Task resumed: {task_id}")
         except Exception as e:
             logger.error(f"Error resuming task: {e}")
     
+    def detach_task(self, task_id, release=True):
+        """Stop a task here without changing its status
+        
+        The lease is released only after the task's last batch has finished,
+        so no other replica can start it while this one is still sending.
+        """
+        runtime = self.active_tasks.pop(task_id, None)
+        if not runtime:
+            return None
+        runtime.stop()
+        return asyncio.create_task(self._finish_detached(runtime, release))
+    
+    async def _finish_detached(self, runtime, release):
+        await runtime.join()
+        await self.checkpointer.flush(runtime.task_id)
+        if release:
+            await self.leases.release(runtime.task_id)
+    
     async def stop_task(self, task_id):
         """Stop a task"""
         try:
+            self.detach_task(task_id)
             await self.db.update_task_status(task_id, "STOPPED")
-            if task_id in self.active_tasks:
-                del self.active_tasks[task_id]
             logger.info(f"Task stopped: {task_id}")
         except Exception as e:
             logger.error(f"Error stopping task: {e}")
@@ -128,9 +302,8 @@ class TaskManager:
     async def delete_task(self, task_id):
         """Delete a task"""
         try:
+            self.detach_task(task_id)
             await self.db.update_task_status(task_id, "DELETED")
-            if task_id in self.active_tasks:
-                del self.active_tasks[task_id]
             logger.info(f"Task deleted: {task_id}")
         except Exception as e:
             logger.error(f"Error deleting task: {e}")
@@ -144,13 +317,15 @@ class TaskManager:
             logger.error(f"Error getting task status: {e}")
             return None
     
-    async def pause_all_tasks(self):
-        """Pause all running tasks"""
+    async def shutdown(self):
+        """Hand this replica's tasks back and write any buffered progress"""
         try:
-            active_tasks = await self.db.get_active_tasks()
-            for task in active_tasks:
-                if task["status"] == "RUNNING":
-                    await self.pause_task(task["_id"])
-            logger.info("All tasks paused")
+            await self.dead_letters.stop()
+            await self.control_plane.stop()
+            handoffs = [self.detach_task(task_id) for task_id in list(self.active_tasks)]
+            await asyncio.gather(*handoffs)
+            await self.leases.stop()
+            await self.checkpointer.close()
+            logger.info("Task progress flushed")
         except Exception as e:
-            logger.error(f"Error pausing all tasks: {e}")                
+            logger.error(f"Error flushing task progress: {e}")
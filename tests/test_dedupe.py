@@ -0,0 +1,95 @@
+import asyncio
+import hashlib
+from types import SimpleNamespace
+from dedupe import BloomFilter, ContentDeduplicator
+
+def digest(value):
+    return hashlib.blake2b(str(value).encode(), digest_size=16).digest()
+
+def make_message(message_id, text="", media_id=None):
+    media = SimpleNamespace(id=media_id) if media_id is not None else None
+    return SimpleNamespace(id=message_id, message=text, photo=media, document=None)
+
+class FakeDB:
+    def __init__(self, state=None):
+        self.state = state
+        self.loads = 0
+    
+    async def get_dedupe_state(self, dest_channel):
+        self.loads += 1
+        await asyncio.sleep(0)
+        return self.state
+    
+    async def save_dedupe_state(self, dest_channel, state):
+        self.state = state
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    for value in range(1000):
+        bloom.add(digest(value))
+    assert all(digest(value) in bloom for value in range(1000))
+    assert bloom.full
+    false_positives = sum(digest(value) in bloom for value in range(1000, 11000))
+    assert false_positives < 300
+
+def test_fingerprint_normalizes_text_and_includes_media():
+    fingerprint = ContentDeduplicator.fingerprint
+    assert fingerprint(make_message(1, "Hello   World")) == fingerprint(make_message(2, " hello world "))
+    assert fingerprint(make_message(1, "hi", media_id=1)) != fingerprint(make_message(1, "hi", media_id=2))
+    assert fingerprint(make_message(1, "")) is None
+
+def test_filter_new_reserves_until_recorded():
+    dedupe = ContentDeduplicator(FakeDB(), "dest")
+    kept, digests = dedupe.filter_new([make_message(1, "a"), make_message(2, "a"), make_message(3, "b")])
+    assert [message.id for message in kept] == [1, 3]
+    # A concurrent batch with the same content waits for the first to finish
+    assert dedupe.filter_new([make_message(4, "a")])[0] == []
+    
+    # Only delivered content is remembered; failed content may be sent again
+    asyncio.run(dedupe.record(digests, {1: object(), 3: None}))
+    assert dedupe.filter_new([make_message(5, "a")])[0] == []
+    assert [message.id for message in dedupe.filter_new([make_message(6, "b")])[0]] == [6]
+
+def test_generations_grow_then_age_out():
+    dedupe = ContentDeduplicator(FakeDB(), "dest", capacity=400, lru_size=10, initial_capacity=100)
+    for value in range(2000):
+        dedupe.add(digest(value))
+    capacities = [generation.capacity for generation in dedupe.generations]
+    assert capacities[-1] == 400
+    # At least capacity hashes of history are kept behind the current generation
+    assert sum(capacities[:-1]) >= 400 and sum(capacities[1:-1]) < 400
+    assert all(dedupe.seen(digest(value)) for value in range(1600, 2000))
+
+def test_growing_generations_halve_their_error_rate():
+    dedupe = ContentDeduplicator(FakeDB(), "dest", capacity=800, error_rate=0.01, initial_capacity=100)
+    for value in range(701):
+        dedupe.add(digest(value))
+    assert [generation.capacity for generation in dedupe.generations] == [100, 200, 400, 800]
+    assert sum(generation.error_rate for generation in dedupe.generations) < 0.01
+
+def test_save_and_load_round_trip():
+    async def run():
+        db = FakeDB()
+        dedupe = ContentDeduplicator(db, "dest", capacity=400, initial_capacity=100)
+        for value in range(300):
+            dedupe.add(digest(value))
+        await dedupe.save(force=True)
+        restored = ContentDeduplicator(db, "dest", capacity=400, initial_capacity=100)
+        await restored.load()
+        return restored
+    
+    restored = asyncio.run(run())
+    assert all(restored.seen(digest(value)) for value in range(300))
+
+def test_shared_loads_once_for_concurrent_callers():
+    async def run():
+        db = FakeDB()
+        ContentDeduplicator._shared.pop("shared-dest", None)
+        first, second = await asyncio.gather(
+            ContentDeduplicator.shared(db, "shared-dest"), ContentDeduplicator.shared(db, "shared-dest")
+        )
+        ContentDeduplicator._shared.pop("shared-dest", None)
+        return first, second, db.loads
+    
+    first, second, loads = asyncio.run(run())
+    assert first is second and loads == 1
@@ -0,0 +1,32 @@
+import asyncio
+from forwarder import ForwardingEngine, MessageRejected
+
+def make_engine(rejected_ids):
+    """An engine whose sends reject any request containing one of rejected_ids"""
+    engine = ForwardingEngine.__new__(ForwardingEngine)
+    engine.requests = []
+    
+    async def forward_messages(dest_channel, message_ids, source_channel):
+        engine.requests.append(list(message_ids))
+        if rejected_ids.intersection(message_ids):
+            raise MessageRejected("MEDIA_INVALID")
+        return [f"fwd-{message_id}" for message_id in message_ids]
+    
+    async def send_with_retry(send, dest_channel, what):
+        return await send()
+    
+    engine.client = type("Client", (), {"forward_messages": staticmethod(forward_messages)})()
+    engine.send_with_retry = send_with_retry
+    return engine
+
+def test_batch_is_sent_whole_when_accepted():
+    engine = make_engine(set())
+    mapped = asyncio.run(engine.forward_batch("src", "dest", [1, 2, 3, 4]))
+    assert mapped == {1: "fwd-1", 2: "fwd-2", 3: "fwd-3", 4: "fwd-4"}
+    assert engine.requests == [[1, 2, 3, 4]]
+
+def test_rejected_batch_is_halved_until_bad_message_is_isolated():
+    engine = make_engine({3})
+    mapped = asyncio.run(engine.forward_batch("src", "dest", [1, 2, 3, 4, 5, 6, 7, 8]))
+    assert mapped == {1: "fwd-1", 2: "fwd-2", 3: None, 4: "fwd-4", 5: "fwd-5", 6: "fwd-6", 7: "fwd-7", 8: "fwd-8"}
+    assert engine.requests == [[1, 2, 3, 4, 5, 6, 7, 8], [1, 2, 3, 4], [1, 2], [3, 4], [3], [4], [5, 6, 7, 8]]
@@ -0,0 +1,84 @@
+import asyncio
+from types import SimpleNamespace
+from leases import TaskLeaseKeeper
+
+class FakeDB:
+    def __init__(self, replicas=1, running=0, orphans=(), owned=None):
+        self.replicas = replicas
+        self.running = running
+        self.orphans = list(orphans)
+        self.owned = owned
+        self.orphan_limit = None
+        self.reported_load = None
+    
+    async def heartbeat_instance(self, instance_id, load, lease_seconds):
+        self.reported_load = load
+    
+    async def renew_task_leases(self, task_ids, instance_id, lease_seconds):
+        return task_ids if self.owned is None else self.owned
+    
+    async def count_live_instances(self):
+        return self.replicas
+    
+    async def count_running_tasks(self):
+        return self.running
+    
+    async def get_orphaned_tasks(self, now, limit):
+        self.orphan_limit = limit
+        return self.orphans[:limit]
+
+class FakeTaskManager:
+    def __init__(self, **statuses):
+        self.active_tasks = {task_id: SimpleNamespace(status=status) for task_id, status in statuses.items()}
+        self.detached = []
+        self.started = []
+    
+    def detach_task(self, task_id, release=True):
+        self.detached.append((task_id, release))
+        self.active_tasks.pop(task_id, None)
+    
+    async def start_task_directly(self, task):
+        self.started.append(task["_id"])
+        self.active_tasks[task["_id"]] = SimpleNamespace(status="RUNNING")
+
+def heartbeat(db, task_manager):
+    asyncio.run(TaskLeaseKeeper(db, task_manager, "me").heartbeat())
+
+def test_fair_share_rounds_up():
+    keeper = TaskLeaseKeeper(FakeDB(replicas=3, running=7), FakeTaskManager(), "me")
+    assert asyncio.run(keeper.fair_share()) == 3
+    keeper = TaskLeaseKeeper(FakeDB(replicas=0, running=2), FakeTaskManager(), "me")
+    assert asyncio.run(keeper.fair_share()) == 2
+
+def test_paused_tasks_do_not_trigger_hand_off():
+    db = FakeDB(replicas=1, running=2)
+    task_manager = FakeTaskManager(a="RUNNING", b="RUNNING", c="PAUSED", d="PAUSED", e="PAUSED")
+    heartbeat(db, task_manager)
+    assert db.reported_load == 2
+    assert task_manager.detached == []
+
+def test_overloaded_replica_hands_off_newest_running_task():
+    db = FakeDB(replicas=2, running=6)
+    task_manager = FakeTaskManager(a="RUNNING", b="RUNNING", c="RUNNING", d="RUNNING", e="RUNNING", f="PAUSED")
+    heartbeat(db, task_manager)
+    assert task_manager.detached == [("e", True)]
+
+def test_load_within_margin_is_kept():
+    db = FakeDB(replicas=2, running=6)
+    task_manager = FakeTaskManager(a="RUNNING", b="RUNNING", c="RUNNING", d="RUNNING")
+    heartbeat(db, task_manager)
+    assert task_manager.detached == []
+
+def test_underloaded_replica_claims_orphans_up_to_fair_share():
+    orphans = [{"_id": task_id} for task_id in ("x", "y", "z")]
+    db = FakeDB(replicas=2, running=6, orphans=orphans)
+    task_manager = FakeTaskManager(a="RUNNING", b="PAUSED")
+    heartbeat(db, task_manager)
+    assert db.orphan_limit == 2
+    assert task_manager.started == ["x", "y"]
+
+def test_lost_leases_stop_without_releasing():
+    db = FakeDB(replicas=1, running=2, owned=["a"])
+    task_manager = FakeTaskManager(a="RUNNING", b="RUNNING")
+    heartbeat(db, task_manager)
+    assert task_manager.detached == [("b", False)]
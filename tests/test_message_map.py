@@ -0,0 +1,63 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from telethon.tl.types import MessageEntityBold
+from message_map import MessageIdBitmap, MessageMap, content_digest, edited_at
+
+def make_message(message_id, text="text", entities=None, edit_date=None, photo=None):
+    return SimpleNamespace(
+        id=message_id, message=text, entities=entities, edit_date=edit_date, photo=photo, document=None
+    )
+
+class FakeDB:
+    def __init__(self, delivered=()):
+        self.delivered = list(delivered)
+        self.entries = []
+    
+    async def iter_delivered_message_ids(self, task_id, dest_channel):
+        for message_id in self.delivered:
+            yield message_id
+    
+    async def bulk_upsert_message_map(self, task_id, dest_channel, entries):
+        self.entries.extend(entries)
+
+def test_bitmap_membership_and_growth():
+    bitmap = MessageIdBitmap()
+    for message_id in (0, 7, 8, 1000, 123457):
+        bitmap.add(message_id)
+    assert all(message_id in bitmap for message_id in (0, 7, 8, 1000, 123457))
+    assert not any(message_id in bitmap for message_id in (1, 9, 999, 123456, 10 ** 9))
+    assert len(bitmap.bits) >= 123457 // 8 + 1
+
+def test_load_and_filter_new_skip_delivered_ids():
+    async def run():
+        message_map = await MessageMap(FakeDB(delivered=[2, 4]), "task", "dest").load()
+        return message_map.filter_new([make_message(i) for i in range(1, 6)])
+    
+    assert [message.id for message in asyncio.run(run())] == [1, 3, 5]
+
+def test_record_keeps_delivered_ids_with_their_content():
+    async def run():
+        db = FakeDB()
+        message_map = MessageMap(db, "task", "dest")
+        sources = [make_message(1, "a"), make_message(2, "b")]
+        message_map.record({1: SimpleNamespace(id=101), 2: None}, sources)
+        await message_map.flush()
+        return db, message_map
+    
+    db, message_map = asyncio.run(run())
+    assert 1 in message_map.delivered and 2 not in message_map.delivered
+    assert [(source_id, dest_id) for source_id, dest_id, _ in db.entries] == [(1, 101)]
+    assert db.entries[0][2] == {"content": content_digest(make_message(1, "a")), "edited_at": 0}
+
+def test_content_digest_tracks_text_entities_and_media():
+    base = content_digest(make_message(1, "hello"))
+    assert content_digest(make_message(2, "hello")) == base
+    assert content_digest(make_message(1, "hello!")) != base
+    assert content_digest(make_message(1, "hello", [MessageEntityBold(0, 5)])) != base
+    assert content_digest(make_message(1, "hello", photo=SimpleNamespace(id=5))) != base
+
+def test_edited_at_is_zero_until_edited():
+    assert edited_at(make_message(1)) == 0
+    edit_date = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    assert edited_at(make_message(1, edit_date=edit_date)) == int(edit_date.timestamp())
@@ -0,0 +1,76 @@
+from telethon.tl.types import MessageEntityBold, MessageEntityTextUrl
+from rewriter import RewritePipeline
+
+def spans(entities):
+    return [(entity.offset, entity.length) for entity in entities]
+
+def test_literal_replacement_remaps_entities_in_utf16():
+    pipeline = RewritePipeline({"replacements": [{"pattern": "cat", "replace": "dog!"}]})
+    # The emoji takes two UTF-16 code units
+    text, entities = pipeline.apply("😀 cat sat", [MessageEntityBold(3, 3), MessageEntityBold(7, 3)])
+    assert text == "😀 dog! sat"
+    assert spans(entities) == [(3, 4), (8, 3)]
+
+def test_entity_inside_removed_text_is_dropped():
+    pipeline = RewritePipeline({"replacements": [{"pattern": "secret ", "replace": ""}]})
+    text, entities = pipeline.apply("a secret b", [MessageEntityBold(2, 6), MessageEntityBold(9, 1)])
+    assert text == "a b"
+    assert spans(entities) == [(2, 1)]
+
+def test_regex_rules_keep_backreferences_and_named_groups():
+    pipeline = RewritePipeline({"replacements": [
+        {"pattern": r"(x)\1", "replace": "Y", "regex": True},
+        {"pattern": r"(?P<n>a+)", "replace": r"<\g<n>>", "regex": True},
+        {"pattern": r"(?P<n>b+)", "replace": "B", "regex": True}
+    ]})
+    assert pipeline.apply("xx aa bb x")[0] == "Y <aa> B x"
+
+def test_replacements_are_not_rewritten_by_later_rules():
+    pipeline = RewritePipeline({"replacements": [
+        {"pattern": "foo", "replace": "bar"},
+        {"pattern": "b", "replace": "B"}
+    ]})
+    assert pipeline.apply("foo b")[0] == "bar B"
+
+def test_earliest_match_wins_and_ties_go_to_the_earlier_rule():
+    pipeline = RewritePipeline({"replacements": [
+        {"pattern": "ab", "replace": "1"},
+        {"pattern": "abc", "replace": "2"},
+        {"pattern": "b", "replace": "3"}
+    ]})
+    assert pipeline.apply("abc xb")[0] == "1c x3"
+
+def test_invalid_rules_are_skipped_and_the_rest_apply():
+    pipeline = RewritePipeline({"replacements": [
+        {"pattern": "(", "regex": True},
+        {"pattern": r"(c)", "replace": r"\2", "regex": True},
+        {"pattern": "a", "replace": "b"}
+    ]})
+    assert len(pipeline.compiled) == 1
+    assert pipeline.apply("aa")[0] == "bb"
+
+def test_strip_links_removes_urls_and_link_entities():
+    pipeline = RewritePipeline({"strip_links": True})
+    text, entities = pipeline.apply(
+        "see https://x.y now", [MessageEntityTextUrl(0, 3, "https://a.b"), MessageEntityBold(15, 4)]
+    )
+    assert text == "see  now"
+    assert spans(entities) == [(4, 4)]
+
+def test_template_prefix_shifts_entities():
+    pipeline = RewritePipeline({"template": ">> {text} <<"})
+    text, entities = pipeline.apply("hi", [MessageEntityBold(0, 2)])
+    assert text == ">> hi <<"
+    assert spans(entities) == [(3, 2)]
+
+def test_template_without_placeholder_is_a_footer():
+    assert RewritePipeline({"template": "footer"}).apply("hi")[0] == "hi\n\nfooter"
+
+def test_entities_are_copied_not_mutated():
+    entity = MessageEntityBold(4, 1)
+    RewritePipeline({"template": "xx {text}"}).apply("abcde", [entity])
+    assert (entity.offset, entity.length) == (4, 1)
+
+def test_from_task_only_builds_a_pipeline_in_copy_mode():
+    assert RewritePipeline.from_task({"mode": "forward", "rewrite": {"template": "x"}}) is None
+    assert RewritePipeline.from_task({"mode": "copy"}).apply("hi")[0] == "hi"
@@ -1,3 +1,4 @@
+import json
 import logging
 import re
 
@@ -65,7 +66,102 @@ class ChannelValidator:
         
         return False, "Channel must be username (@channel) or numeric ID (e.g., -1002324861641)"
 
+class TaskOptionsValidator:
+    # Per-task settings a user may edit; anything else in a task is internal
+    KEYS = ("mode", "filters", "rewrite", "dedupe")
+    
+    @staticmethod
+    def validate_task_options(text):
+        """Parse and check a JSON object of task options"""
+        from filters import MessageFilter
+        from rewriter import RewritePipeline
+        
+        try:
+            options = json.loads(text)
+        except ValueError as e:
+            return False, f"Invalid JSON: {e}"
+        if not isinstance(options, dict) or not options:
+            return False, "Send a JSON object, e.g. {\"mode\": \"copy\"}"
+        
+        unknown = [key for key in options if key not in TaskOptionsValidator.KEYS]
+        if unknown:
+            return False, f"Unknown options: {', '.join(unknown)}. Allowed: {', '.join(TaskOptionsValidator.KEYS)}"
+        if "mode" in options and options["mode"] not in ("forward", "copy"):
+            return False, "mode must be \"forward\" or \"copy\""
+        if "dedupe" in options and not isinstance(options["dedupe"], bool):
+            return False, "dedupe must be true or false"
+        
+        try:
+            if options.get("filters") is not None:
+                MessageFilter(options["filters"])
+            rewrite = options.get("rewrite")
+            if rewrite is not None:
+                pipeline = RewritePipeline(rewrite)
+                # Invalid replacement rules are skipped, not raised
+                if len(pipeline.compiled) != len(rewrite.get("replacements", [])) + pipeline.strip_links:
+                    return False, "Invalid rewrite replacement rule"
+        except (re.error, ValueError, TypeError, KeyError, AttributeError) as e:
+            return False, f"Invalid filters or rewrite rules: {e}"
+        
+        return True, options
+
+class ErrorClass:
+    """How the forwarding engine should act on an error"""
+    RETRYABLE = "retryable"  # back off and try again
+    SKIP = "skip"  # give up on this message, continue the task
+    DESTINATION = "destination"  # the destination refuses our posts; open its circuit
+    FATAL = "fatal"  # the task can't continue
+
+class TaskFatalError(Exception):
+    """Raised when an error means the task can't make progress"""
+
 class ErrorHandler:
+    # Telethon RPC errors by class name; anything unlisted falls back to its code
+    SKIP_ERRORS = {
+        "MessageIdInvalidError", "MessageIdsEmptyError", "MessageEmptyError",
+        "MessageTooLongError", "MediaCaptionTooLongError", "MediaEmptyError",
+        "MediaInvalidError", "GroupedMediaInvalidError", "FileReferenceExpiredError",
+        "WebpageCurlFailedError", "WebpageMediaEmptyError", "ChatSendMediaForbiddenError",
+        "ChatSendGifsForbiddenError", "ChatSendStickersForbiddenError", "ChatSendPollForbiddenError",
+        "PollOptionInvalidError", "RandomIdDuplicateError", "EntityBoundsInvalidError"
+    }
+    DESTINATION_ERRORS = {
+        "ChatWriteForbiddenError", "ChatAdminRequiredError", "ChatRestrictedError",
+        "UserBannedInChannelError", "ChatSendPlainForbiddenError", "ChatGuestSendForbiddenError"
+    }
+    FATAL_ERRORS = {
+        "ChannelPrivateError", "ChannelInvalidError", "ChatIdInvalidError", "PeerIdInvalidError",
+        "ChatForbiddenError", "UsernameInvalidError", "UsernameNotOccupiedError", "AuthKeyUnregisteredError", "AuthKeyDuplicatedError",
+        "SessionRevokedError", "SessionExpiredError", "UserDeactivatedError",
+        "UserDeactivatedBanError"
+    }
+    
+    @classmethod
+    def classify(cls, error):
+        """Map an exception to an ErrorClass"""
+        names = {klass.__name__ for klass in type(error).__mro__}
+        if names & cls.DESTINATION_ERRORS:
+            return ErrorClass.DESTINATION
+        if names & cls.FATAL_ERRORS:
+            return ErrorClass.FATAL
+        if names & cls.SKIP_ERRORS:
+            return ErrorClass.SKIP
+        
+        code = getattr(error, "code", None)
+        if isinstance(code, int):
+            if code == 403:
+                return ErrorClass.DESTINATION
+            if code == 401:
+                return ErrorClass.FATAL
+            if code == 400:
+                return ErrorClass.SKIP
+            return ErrorClass.RETRYABLE
+        
+        # Telethon raises ValueError when a peer can't be resolved
+        if isinstance(error, ValueError):
+            return ErrorClass.FATAL
+        return ErrorClass.RETRYABLE
+    
     @staticmethod
     def get_error_message(error):
         """Get user-friendly error message"""